@@ -1,6 +1,7 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, Request, Form
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from typing import List, Any
+import asyncio
 import uvicorn
 import traceback
 from models import StandardResponse, ResponseStatusEnum
@@ -15,10 +16,29 @@ import uuid
 
 logger = logging.getLogger()
 
-from license_manager import LicenseManager
+from license_manager import (
+    LicenseManager,
+    LicenseMiddleware,
+    close_licensing_client,
+    get_usage_meter,
+)
 from service_manager import ServiceManager
+from service_manager.admission import ServiceOverloaded
+from service_manager.jobs import get_job_manager
+from service_manager.service_manager import SERVICE_REGISTRY, form_params
+from service_manager.warmup import (
+    get_warmup_state,
+    preload_models,
+    run_warmup,
+    start_servers,
+)
+from service_runtime import shutdown_executors
+from service_runtime.metrics import clear_multiprocess_dir, render_metrics
+from service_runtime.prefork import SERVER_WORKERS, serve_prefork
 
 app = FastAPI(debug=True)
+# Rejects invalid licenses before the upload body of these endpoints is read
+app.add_middleware(LicenseMiddleware, paths=["/process", "/jobs"])
 
 # Define storage directory (must be mounted as a volume in Docker)
 if os.getenv("DOCKER_ENV") == "true":  # Docker environment variable
@@ -30,23 +50,99 @@ else:  # Running locally (Mac)
 Path(STORAGE_DIR).mkdir(parents=True, exist_ok=True)
 
 
+@app.on_event("startup")
+async def on_startup():
+    logger.info(f"Enabled services: {SERVICE_REGISTRY.enabled_services()}")
+    if SERVER_WORKERS == 1:
+        # Metrics of a previous run. In pre-fork mode the master does it before forking
+        clear_multiprocess_dir()
+    # Before the CPU workers start, they connect to these processes
+    start_servers()
+    # In the background, /healthz answers while the models warm up
+    app.state.warmup_task = asyncio.create_task(run_warmup())
+    await get_job_manager().start()
+    await get_usage_meter().start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await get_job_manager().stop()
+    # Writes the usage counted since the last flush
+    await get_usage_meter().stop()
+    await close_licensing_client()
+    shutdown_executors(wait=False)
+
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness probe: the process is up and the event loop responds."""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness probe: 200 only once the enabled models are loaded and warm."""
+    state = get_warmup_state()
+    return JSONResponse(status_code=200 if state.ready else 503, content=state.to_dict())
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics, see service_runtime/metrics.py."""
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
+
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     traceback.print_exc()
     return JSONResponse(status_code=500, content={"detail": str(exc)})
 
 
+async def _verify_license(request: Request, license_key: str | None) -> tuple[bool, str]:
+    """
+    The license was usually verified by LicenseMiddleware already, from the
+    X-License-Key header or a license_key field sent before the files.
+    """
+    if request.scope.get("state", {}).get("license_verified"):
+        return True, "License verified before the upload."
+    if not license_key:
+        return False, "license_key is required."
+    return await LicenseManager(license_key=license_key).verify()
+
+
+def _license_key(request: Request, license_key: str | None) -> str | None:
+    """The verified key, also when LicenseMiddleware took it from the header."""
+    return request.scope.get("state", {}).get("license_key", license_key)
+
+
+def _record_usage(license_key: str | None, service_name: str, response: Any):
+    """Counts the request for billing, a batch counts once per service it ran."""
+    meter = get_usage_meter()
+    if service_name == ServicesEnum.Batch and isinstance(response, StandardResponse):
+        if isinstance(response.result, dict):
+            for name, sub_response in response.result.items():
+                meter.record(
+                    license_key, name, sub_response.status == ResponseStatusEnum.success
+                )
+            return
+    ok = not (
+        isinstance(response, StandardResponse)
+        and response.status != ResponseStatusEnum.success
+    )
+    meter.record(license_key, service_name, ok)
+
+
 @app.post("/process", response_model=StandardResponse | Any)
 async def process_endpoint(
     request: Request,
     service_name: ServicesEnum = Form(...),
-    license_key: str = Form(...),
+    license_key: str = Form(None),
     license_endpoint: str = Form(None),
     files: List[UploadFile] = File([]),
 ):
     # Verify the license key
-    lm = LicenseManager(license_key=license_key)
-    res, message = await lm.verify()
+    res, message = await _verify_license(request, license_key)
 
     if not res:
         return StandardResponse(
@@ -67,9 +163,14 @@ async def process_endpoint(
             request=request,
             files=files,
         )
+        _record_usage(_license_key(request, license_key), service_name, response)
         return response
+    except ServiceOverloaded as e:
+        logger.warning(str(e))
+        return _overloaded_response(e)
     except Exception as e:
         logger.exception(e)
+        get_usage_meter().record(_license_key(request, license_key), service_name, ok=False)
         return StandardResponse(
             status=ResponseStatusEnum.failure,
             message="Services has failed. Please contact lyik support.",
@@ -77,6 +178,97 @@ async def process_endpoint(
         )
 
 
+def _overloaded_response(e: ServiceOverloaded) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        headers={"Retry-After": str(e.retry_after)},
+        content=StandardResponse(
+            status=ResponseStatusEnum.failure,
+            message=str(e),
+            metadata={"retry_after": e.retry_after},
+        ).model_dump(mode="json"),
+    )
+
+
+@app.post("/jobs", response_model=StandardResponse, status_code=202)
+async def submit_job_endpoint(
+    request: Request,
+    service_name: ServicesEnum = Form(...),
+    license_key: str = Form(None),
+    license_endpoint: str = Form(None),
+    files: List[UploadFile] = File([]),
+):
+    """
+    Queues a service request and returns a job id straight away.
+    Takes the same form fields as /process. Poll GET /jobs/{job_id} for progress.
+    """
+    res, message = await _verify_license(request, license_key)
+
+    if not res:
+        return JSONResponse(
+            status_code=200,
+            content=StandardResponse(
+                status=ResponseStatusEnum.failure.value,
+                message=str(message),
+            ).model_dump(mode="json"),
+        )
+
+    try:
+        job = await get_job_manager().submit(
+            service_name=service_name,
+            files=files,
+            additional_params=await form_params(request),
+        )
+    except ServiceOverloaded as e:
+        logger.warning(str(e))
+        return _overloaded_response(e)
+
+    # Counted when accepted, the job runs after this request has returned
+    get_usage_meter().record(_license_key(request, license_key), service_name)
+    return StandardResponse(
+        status=ResponseStatusEnum.success,
+        message="Job submitted",
+        result={"job_id": job.job_id, "status": job.status},
+    )
+
+
+@app.get("/jobs/{job_id}", response_model=StandardResponse)
+async def job_status_endpoint(job_id: str):
+    """Returns the job status, its current stage and, once finished, its result."""
+    job = await get_job_manager().get(job_id)
+    if job is None:
+        return JSONResponse(
+            status_code=404,
+            content=StandardResponse(
+                status=ResponseStatusEnum.failure, message=f"Job {job_id} not found"
+            ).model_dump(mode="json"),
+        )
+    return StandardResponse(
+        status=ResponseStatusEnum.success,
+        message=f"Job is {job.status.value}",
+        result=job,
+    )
+
+
+@app.get("/jobs/{job_id}/result", response_model=StandardResponse | Any)
+async def job_result_endpoint(job_id: str):
+    """Returns the service response of a finished job, exactly as /process would have."""
+    job = await get_job_manager().get(job_id)
+    if job is None or job.result is None:
+        return JSONResponse(
+            status_code=404 if job is None else 409,
+            content=StandardResponse(
+                status=ResponseStatusEnum.failure,
+                message=(
+                    f"Job {job_id} not found"
+                    if job is None
+                    else f"Job is {job.status.value}"
+                ),
+            ).model_dump(mode="json"),
+        )
+    return job.result
+
+
 async def save_files(service_name: str, files: List[UploadFile]):
     """
     Method to save the files given when api is invoked, in a directory including its timestamp, and service name.
@@ -102,4 +294,15 @@ if __name__ == "__main__":
     # It looks like the startup is sequential just like any python app
     # NOTE: There are ways to instruct uvicorn to start the application with import string
     # But in that case it looks like the python imports are not handled properly. Have to investigate this more
-    uvicorn.run(app=app, host="0.0.0.0", port=8000, reload=False, log_level="debug")
+    if SERVER_WORKERS > 1:
+        # Models are loaded once in the master and shared copy-on-write by the workers
+        serve_prefork(
+            app,
+            host="0.0.0.0",
+            port=8000,
+            workers=SERVER_WORKERS,
+            preload=preload_models,
+            log_level="debug",
+        )
+    else:
+        uvicorn.run(app=app, host="0.0.0.0", port=8000, reload=False, log_level="debug")
@@ -0,0 +1,42 @@
+"""
+Micro-benchmark of the per-request LangGraph overhead of the OCR pipelines.
+
+Compares building and compiling the StateGraph on every request, as process_document
+and process_known_document used to, with reusing the cached compiled graph. Run from
+the repository root:
+
+    python -m benchmarks.bench_langgraph_pipeline [iterations]
+"""
+
+import sys
+import time
+
+from service_handlers.agent_ocr.agent.agent_pipeline import (
+    build_langraph_known_pipeline,
+    build_langraph_pipeline,
+    get_langraph_known_pipeline,
+    get_langraph_pipeline,
+)
+
+
+def _per_call_us(func, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main(iterations: int = 200):
+    print(f"{'pipeline':<10} {'rebuilt (us)':>14} {'cached (us)':>12}")
+    for name, build, get in (
+        ("unknown", build_langraph_pipeline, get_langraph_pipeline),
+        ("known", build_langraph_known_pipeline, get_langraph_known_pipeline),
+    ):
+        get()  # first use builds it
+        rebuilt = _per_call_us(build, iterations)
+        cached = _per_call_us(get, iterations)
+        print(f"{name:<10} {rebuilt:>14.1f} {cached:>12.3f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
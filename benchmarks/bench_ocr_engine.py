@@ -0,0 +1,53 @@
+"""
+Throughput of the batched OCR engine against one image at a time.
+
+Runs the same synthetic card-like images through `PaddleOCR.ocr`, one after the other,
+and through the engine, with its OCR_ENGINE_POOL_SIZE OCR threads, from several threads
+at once. Run from the repository root:
+
+    python -m benchmarks.bench_ocr_engine [images] [threads]
+"""
+
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from service_handlers.ocr_engine import build_paddle_ocr, get_ocr_engine, warm_up
+
+
+def _synthetic_image(i: int) -> np.ndarray:
+    img = np.full((480, 760, 3), 255, dtype=np.uint8)
+    for row, text in enumerate(
+        ("GOVERNMENT OF INDIA", f"NAME SAMPLE PERSON {i}", "DOB 01/01/1990", f"{1234 + i} 5678 9012")
+    ):
+        cv2.putText(img, text, (30, 80 + row * 100), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 0), 2)
+    return img
+
+
+def main(images: int = 32, threads: int = 8):
+    engine = get_ocr_engine()
+    batch = [_synthetic_image(i) for i in range(images)]
+    warm_up()  # loads and warms the models, starts the OCR threads
+    ocr = build_paddle_ocr()
+    ocr.ocr(batch[0])
+
+    started = time.perf_counter()
+    for img in batch:
+        ocr.ocr(img)
+    sequential = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(engine.ocr_lines, batch))
+    batched = time.perf_counter() - started
+
+    print(f"one at a time: {images / sequential:6.2f} images/s")
+    print(f"batched ({threads} threads): {images / batched:6.2f} images/s")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
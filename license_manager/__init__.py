@@ -1 +1,4 @@
-from .license import LicenseManager
\ No newline at end of file
+from .license import LicenseManager
+from .http_client import close_licensing_client
+from .middleware import LicenseMiddleware
+from .usage import get_usage_meter
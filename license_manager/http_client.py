@@ -0,0 +1,73 @@
+"""
+Process wide HTTP client for the licensing server.
+
+One pooled `httpx.AsyncClient` keeps connections (and their TLS sessions) alive
+between license verifications instead of opening a new connection per call. Timeouts
+are tight so a slow licensing server cannot stall the request path for long:
+
+    LICENSING_HTTP2                  true | false   (default: true, needs the `h2` package)
+    LICENSING_CONNECT_TIMEOUT        seconds        (default: 3)
+    LICENSING_READ_TIMEOUT           seconds        (default: 5)
+    LICENSING_POOL_TIMEOUT           seconds to wait for a free connection (default: 2)
+    LICENSING_MAX_CONNECTIONS        (default: 20)
+    LICENSING_MAX_KEEPALIVE          idle connections kept open (default: 10)
+    LICENSING_KEEPALIVE_EXPIRY       seconds an idle connection is kept (default: 60)
+"""
+
+import logging
+import os
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+LICENSING_HTTP2 = os.getenv("LICENSING_HTTP2", "true").lower() == "true"
+LICENSING_CONNECT_TIMEOUT = float(os.getenv("LICENSING_CONNECT_TIMEOUT", 3))
+LICENSING_READ_TIMEOUT = float(os.getenv("LICENSING_READ_TIMEOUT", 5))
+LICENSING_POOL_TIMEOUT = float(os.getenv("LICENSING_POOL_TIMEOUT", 2))
+LICENSING_MAX_CONNECTIONS = int(os.getenv("LICENSING_MAX_CONNECTIONS", 20))
+LICENSING_MAX_KEEPALIVE = int(os.getenv("LICENSING_MAX_KEEPALIVE", 10))
+LICENSING_KEEPALIVE_EXPIRY = float(os.getenv("LICENSING_KEEPALIVE_EXPIRY", 60))
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    if not LICENSING_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("h2 is not installed, licensing calls use HTTP/1.1")
+        return False
+    return True
+
+
+def get_licensing_client() -> httpx.AsyncClient:
+    """Returns the shared licensing client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=_http2_available(),
+            timeout=httpx.Timeout(
+                LICENSING_READ_TIMEOUT,
+                connect=LICENSING_CONNECT_TIMEOUT,
+                pool=LICENSING_POOL_TIMEOUT,
+            ),
+            limits=httpx.Limits(
+                max_connections=LICENSING_MAX_CONNECTIONS,
+                max_keepalive_connections=LICENSING_MAX_KEEPALIVE,
+                keepalive_expiry=LICENSING_KEEPALIVE_EXPIRY,
+            ),
+            headers={"Content-Type": "application/json"},
+        )
+    return _client
+
+
+async def close_licensing_client():
+    """Closes the pooled connections. Called on application shutdown."""
+    global _client
+    client, _client = _client, None
+    if client is not None and not client.is_closed:
+        await client.aclose()
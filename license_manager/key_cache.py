@@ -0,0 +1,119 @@
+"""
+kid -> public key cache for license JWT verification.
+
+Signing keys rarely change, so the public key of a `kid` is fetched from the licensing
+server once and kept, already parsed, for PUBLIC_KEY_TTL seconds. A license cache miss
+then costs one licensing round trip (`/verify_license`) instead of two. Rotation works
+like a JWKS cache: an unknown kid, or a signature that no longer verifies with the
+cached key, triggers one refresh. Refreshes of the same kid are at most once per
+PUBLIC_KEY_REFRESH_INTERVAL seconds, failed lookups included, and concurrent lookups
+of a kid share one fetch. With a shared LICENSE_CACHE_BACKEND (see store.py) the PEMs
+are also kept there, so a worker, or a restarted server, reuses a key another one fetched.
+
+    PUBLIC_KEY_TTL                 seconds   (default: 86400)
+    PUBLIC_KEY_CACHE_SIZE          kids      (default: 100)
+    PUBLIC_KEY_REFRESH_INTERVAL    seconds   (default: 30)
+"""
+
+import logging
+import os
+from typing import Any, Awaitable, Callable
+
+from cachetools import TTLCache
+from jwt.algorithms import RSAAlgorithm
+
+from service_runtime.metrics import record_cache
+from service_runtime.single_flight import SingleFlight
+
+from .store import LicenseStore, get_license_store
+
+logger = logging.getLogger(__name__)
+
+PUBLIC_KEY_TTL = int(os.getenv("PUBLIC_KEY_TTL", 86400))
+PUBLIC_KEY_CACHE_SIZE = int(os.getenv("PUBLIC_KEY_CACHE_SIZE", 100))
+PUBLIC_KEY_REFRESH_INTERVAL = float(os.getenv("PUBLIC_KEY_REFRESH_INTERVAL", 30))
+
+# Fetches the PEM public key of a kid from the licensing server
+KeyFetcher = Callable[[str], Awaitable[str]]
+
+_RS256 = RSAAlgorithm(RSAAlgorithm.SHA256)
+
+
+class PublicKeyCache:
+    def __init__(
+        self,
+        ttl: int = PUBLIC_KEY_TTL,
+        maxsize: int = PUBLIC_KEY_CACHE_SIZE,
+        refresh_interval: float = PUBLIC_KEY_REFRESH_INTERVAL,
+    ):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.refresh_interval = refresh_interval
+        # kid -> parsed public key
+        self._keys = TTLCache(maxsize=maxsize, ttl=ttl)
+        # kid -> None or the exception, for kids fetched within the refresh interval
+        self._recent = TTLCache(maxsize=maxsize, ttl=refresh_interval)
+        self._fetches = SingleFlight()
+
+    async def get(self, kid: str, fetch: KeyFetcher, force_refresh: bool = False) -> Any:
+        """
+        Returns the parsed public key of `kid`. `force_refresh` re-fetches a cached key,
+        e.g. after a signature failure, unless it was fetched within the refresh interval.
+        """
+        key = self._keys.get(kid)
+        if key is not None and not force_refresh:
+            record_cache("public_key", hit=True)
+            return key
+
+        if kid in self._recent:
+            # Fetched a moment ago: reuse that outcome instead of asking again
+            if key is not None:
+                return key
+            error = self._recent[kid]
+            if error is not None:
+                raise error
+
+        if not force_refresh:
+            key = await self._load(kid)
+            if key is not None:
+                record_cache("public_key", hit=True)
+                return key
+
+        record_cache("public_key", hit=False)
+        return await self._fetches.do(kid, lambda: self._fetch(kid, fetch))
+
+    def _store(self) -> LicenseStore:
+        return get_license_store("public_key", self.maxsize, self.ttl)
+
+    async def _load(self, kid: str) -> Any:
+        """The key from the shared store, None when it is not there."""
+        entry = await self._store().get(kid)
+        if entry is None:
+            return None
+        try:
+            key = _RS256.prepare_key(entry["pem"])
+        except Exception as e:
+            logger.warning(f"Ignoring unparsable cached public key for kid {kid}: {e}")
+            return None
+        self._keys[kid] = key
+        return key
+
+    async def _fetch(self, kid: str, fetch: KeyFetcher) -> Any:
+        try:
+            pem = await fetch(kid)
+            key = _RS256.prepare_key(pem)
+        except Exception as e:
+            self._recent[kid] = e
+            raise
+        self._recent[kid] = None
+        self._keys[kid] = key
+        await self._store().set(kid, {"pem": pem})
+        logger.info(f"Fetched public key for kid {kid}")
+        return key
+
+    def clear(self):
+        self._keys.clear()
+        self._recent.clear()
+
+
+PUBLIC_KEY_CACHE = PublicKeyCache()
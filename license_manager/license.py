@@ -1,11 +1,17 @@
 from datetime import datetime, timedelta
+import asyncio
 import logging
 import os
-import httpx
+import time
 import jwt
 from pydantic import BaseModel
-from cachetools import TTLCache
-from typing import Tuple
+from typing import Dict, Set, Tuple
+
+from service_runtime.metrics import record_cache
+from service_runtime.single_flight import SingleFlight
+from .http_client import get_licensing_client
+from .key_cache import PUBLIC_KEY_CACHE
+from .store import LICENSE_CACHE_SIZE, LicenseStore, get_license_store, hash_license_key
 
 logger = logging.getLogger(__name__)
 
@@ -27,42 +33,64 @@ class InvalidLicense(Exception):
     pass
 
 
-# TTL Cache for license info: max 100 items, 24hr TTL
-LICENSE_CACHE = TTLCache(maxsize=100, ttl=86400)
+# A verified license is fresh for LICENSE_CACHE_TTL seconds. Once past
+# LICENSE_REFRESH_AHEAD of that it is re-verified in the background, and after it
+# expired it is still served for LICENSE_STALE_GRACE seconds while a background
+# re-verification runs, so a slow or unreachable licensing server does not add
+# latency or failures for known licenses.
+LICENSE_CACHE_TTL = int(os.getenv("LICENSE_CACHE_TTL", 86400))
+LICENSE_REFRESH_AHEAD = float(os.getenv("LICENSE_REFRESH_AHEAD", 0.8))
+LICENSE_STALE_GRACE = int(os.getenv("LICENSE_STALE_GRACE", 3600))
+# After a failed background refresh the key is not refreshed again for
+# LICENSE_REFRESH_RETRY seconds, doubling with every further failure up to
+# LICENSE_REFRESH_RETRY_MAX, so a struggling licensing server is not hit per request.
+LICENSE_REFRESH_RETRY = float(os.getenv("LICENSE_REFRESH_RETRY", 30))
+LICENSE_REFRESH_RETRY_MAX = float(os.getenv("LICENSE_REFRESH_RETRY_MAX", 600))
+
 MESSAGE = str
 
 
+def _license_cache() -> LicenseStore:
+    """Verified license info, entries are dropped after the grace window (see store.py)."""
+    return get_license_store(
+        "license", LICENSE_CACHE_SIZE, LICENSE_CACHE_TTL + LICENSE_STALE_GRACE
+    )
+
+
+# Concurrent cache misses of the same key share one verification with the server
+_VERIFICATIONS = SingleFlight()
+# Keeps the background refresh tasks referenced until they are done
+_REFRESH_TASKS: Set[asyncio.Task] = set()
+# cache key -> (time of the next allowed refresh, consecutive failures)
+_REFRESH_BACKOFF: Dict[str, Tuple[float, int]] = {}
+
+
 class LicenseManager:
     def __init__(self, license_key):
         self.LICENSING_ENDPOINT = os.getenv("LICENSING_ENDPOINT")
         self.LICENSE_KEY = license_key
+        # The cache is possibly shared on disk or in Redis, it never sees the key itself
+        self._cache_key = hash_license_key(license_key)
 
     async def verify(self) -> Tuple[bool, MESSAGE]:
         try:
             now = datetime.now()
-            license_data = LICENSE_CACHE.get(self.LICENSE_KEY)
+            license_data = await _license_cache().get(self._cache_key)
 
             if license_data:
                 license_expiry = self.to_datetime(license_data["license_expiry_time"])
                 if license_expiry > now:
+                    record_cache("license", hit=True)
+                    age = time.time() - license_data.get("verified_at", 0)
+                    if age >= LICENSE_CACHE_TTL * LICENSE_REFRESH_AHEAD:
+                        self._refresh_in_background()
+                    if age >= LICENSE_CACHE_TTL:
+                        return True, "License verified from cache (revalidating)."
                     return True, "License verified from cache."
+            record_cache("license", hit=False)
 
             # Cache expired or missing; fetch fresh
-            _jwt = await self.fetch()
-            _payload = await self._get_payload(_jwt)
-
-            valid_from = _payload["license_data"]["valid_from"]
-            valid_to = _payload["license_data"]["valid_to"]
-
-            if self._is_premature(valid_from) or not self._is_live(valid_to):
-                raise InvalidLicense("License is invalid")
-
-            license_data = {
-                "organization_name": _payload["license_data"]["organisation_name"],
-                "license_expiry_time": valid_to,
-            }
-
-            LICENSE_CACHE[self.LICENSE_KEY] = license_data
+            await _VERIFICATIONS.do(self.LICENSE_KEY, self._verify_with_server)
             return True, "License verified with server."
 
         except (TokenNotFound, LicenseNotFound, InvalidLicense, InvalidToken) as e:
@@ -70,13 +98,59 @@ class LicenseManager:
         except Exception as e:
             return False, f"Unexpected error: {str(e)}"
 
-    async def fetch(self):
-        async with httpx.AsyncClient(timeout=httpx.Timeout(60, connect=60)) as client:
-            res = await client.post(
-                f"{self.LICENSING_ENDPOINT}/verify_license",
-                json={"key": self.LICENSE_KEY},
-                headers={"Content-Type": "application/json"},
+    async def _verify_with_server(self) -> dict:
+        """Fetches and validates the license, caches it. Raises when it is not valid."""
+        _jwt = await self.fetch()
+        _payload = await self._get_payload(_jwt)
+
+        valid_from = _payload["license_data"]["valid_from"]
+        valid_to = _payload["license_data"]["valid_to"]
+
+        if self._is_premature(valid_from) or not self._is_live(valid_to):
+            raise InvalidLicense("License is invalid")
+
+        license_data = {
+            "organization_name": _payload["license_data"]["organisation_name"],
+            "license_expiry_time": valid_to,
+            "verified_at": time.time(),
+        }
+
+        await _license_cache().set(self._cache_key, license_data)
+        return license_data
+
+    def _refresh_in_background(self):
+        if _VERIFICATIONS.in_flight(self.LICENSE_KEY):
+            return
+        retry_at, _ = _REFRESH_BACKOFF.get(self._cache_key, (0.0, 0))
+        if time.time() < retry_at:
+            return
+        task = asyncio.create_task(self._refresh())
+        _REFRESH_TASKS.add(task)
+        task.add_done_callback(_REFRESH_TASKS.discard)
+
+    async def _refresh(self):
+        try:
+            await _VERIFICATIONS.do(self.LICENSE_KEY, self._verify_with_server)
+            _REFRESH_BACKOFF.pop(self._cache_key, None)
+        except (LicenseNotFound, InvalidLicense) as e:
+            # The server says the license is gone, stop serving it
+            _REFRESH_BACKOFF.pop(self._cache_key, None)
+            await _license_cache().delete(self._cache_key)
+            logger.warning(f"License no longer valid, removed from cache: {e}")
+        except Exception as e:
+            # Unreachable or erroring server: keep serving the cached license, retry later
+            _, failures = _REFRESH_BACKOFF.get(self._cache_key, (0.0, 0))
+            delay = min(LICENSE_REFRESH_RETRY_MAX, LICENSE_REFRESH_RETRY * 2**failures)
+            _REFRESH_BACKOFF[self._cache_key] = (time.time() + delay, failures + 1)
+            logger.warning(
+                f"Background license refresh failed, next attempt in {delay:.0f}s: {e}"
             )
+
+    async def fetch(self):
+        res = await get_licensing_client().post(
+            f"{self.LICENSING_ENDPOINT}/verify_license",
+            json={"key": self.LICENSE_KEY},
+        )
         response = res.json()
         if response.get("status_code") == 200:
             return response["token"]
@@ -92,16 +166,15 @@ class LicenseManager:
             if not kid:
                 raise InvalidToken("Token verification failed due to missing 'kid'")
 
-            async with httpx.AsyncClient() as client:
-                res = await client.post(
-                    f"{self.LICENSING_ENDPOINT}/fetch_secret",
-                    json={"kid": kid},
-                    headers={"Content-Type": "application/json"},
+            key = await PUBLIC_KEY_CACHE.get(kid, self._fetch_public_key)
+            try:
+                return jwt.decode(token, key, algorithms=["RS256"])
+            except jwt.InvalidSignatureError:
+                # The key behind this kid may have been rotated, refresh it once
+                key = await PUBLIC_KEY_CACHE.get(
+                    kid, self._fetch_public_key, force_refresh=True
                 )
-
-            response = res.json()
-            secret = response["public_key"]
-            return jwt.decode(token, secret, algorithms=["RS256"])
+                return jwt.decode(token, key, algorithms=["RS256"])
 
         except jwt.ExpiredSignatureError:
             raise InvalidToken("Token has expired")
@@ -110,6 +183,14 @@ class LicenseManager:
                 f"Invalid token or payload could not be decoded - {str(e)}"
             )
 
+    async def _fetch_public_key(self, kid: str) -> str:
+        res = await get_licensing_client().post(
+            f"{self.LICENSING_ENDPOINT}/fetch_secret",
+            json={"kid": kid},
+        )
+        response = res.json()
+        return response["public_key"]
+
     def _is_live(self, valid_to) -> bool:
         valid_to_date = self.to_datetime(valid_to)
         days_remaining = (valid_to_date - datetime.now()).days
@@ -0,0 +1,141 @@
+"""
+License check ahead of the request body.
+
+Endpoints declaring `UploadFile` params get the whole multipart body read and spooled
+before they run, possibly a large liveness video, only to then reject an invalid
+license. This ASGI middleware verifies the license first and answers an invalid one
+without consuming the upload. The key is taken from the `X-License-Key` header or,
+failing that, from the `license_key` form field when it comes before the first file.
+Only the first LICENSE_PEEK_BYTES of the body are buffered to look for it, and
+replayed unchanged to the endpoint, so the form is still parsed once. Requests whose
+key comes after the files are verified by the endpoint as before.
+
+    LICENSE_PEEK_BYTES    (default: 65536)
+"""
+
+import os
+import re
+from typing import Iterable, List, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from models import StandardResponse, ResponseStatusEnum
+from .license import LicenseManager
+
+LICENSE_HEADER = "x-license-key"
+LICENSE_FIELD = "license_key"
+LICENSE_PEEK_BYTES = int(os.getenv("LICENSE_PEEK_BYTES", 65536))
+
+_BOUNDARY = re.compile(r'boundary="?([^";]+)"?', re.IGNORECASE)
+_FIELD_NAME = re.compile(rb'\bname="([^"]*)"', re.IGNORECASE)
+
+
+class LicenseMiddleware:
+    def __init__(self, app: ASGIApp, paths: Iterable[str]):
+        self.app = app
+        self.paths = set(paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] not in self.paths
+        ):
+            return await self.app(scope, receive, send)
+
+        headers = Headers(scope=scope)
+        license_key = headers.get(LICENSE_HEADER)
+        peeked: List[bytes] = []
+        more_body = True
+        if license_key is None:
+            license_key, peeked, more_body = await _peek_license_field(headers, receive)
+
+        if license_key is not None:
+            verified, message = await LicenseManager(license_key=license_key).verify()
+            if not verified:
+                # Same answer as the endpoints give, the unread body is dropped with the connection
+                response = JSONResponse(
+                    status_code=200,
+                    content=StandardResponse(
+                        status=ResponseStatusEnum.failure, message=str(message)
+                    ).model_dump(mode="json"),
+                )
+                return await response(scope, receive, send)
+            state = scope.setdefault("state", {})
+            state["license_verified"] = True
+            state["license_key"] = license_key
+
+        if peeked:
+            receive = _replay(b"".join(peeked), more_body, receive)
+        await self.app(scope, receive, send)
+
+
+async def _peek_license_field(
+    headers: Headers, receive: Receive
+) -> Tuple[Optional[str], List[bytes], bool]:
+    """
+    Reads the start of a multipart body until the license field, the first file or
+    LICENSE_PEEK_BYTES. Returns the key (None when not found), the chunks read and
+    whether more body follows them.
+    """
+    match = _BOUNDARY.search(headers.get("content-type", ""))
+    if not headers.get("content-type", "").startswith("multipart/form-data") or not match:
+        return None, [], True
+
+    delimiter = b"--" + match.group(1).encode("latin-1")
+    chunks: List[bytes] = []
+    size = 0
+    more_body = True
+    while more_body and size < LICENSE_PEEK_BYTES:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunk = message.get("body", b"")
+        chunks.append(chunk)
+        size += len(chunk)
+        more_body = message.get("more_body", False)
+
+        value, done = _find_field(b"".join(chunks), delimiter)
+        if value is not None or done:
+            return value, chunks, more_body
+    return None, chunks, more_body
+
+
+def _find_field(data: bytes, delimiter: bytes) -> Tuple[Optional[str], bool]:
+    """
+    Looks for the license field among the complete leading parts of `data`. `done` is
+    True once the search cannot succeed any more, i.e. a file part was reached.
+    """
+    position = data.find(delimiter)
+    while position != -1:
+        headers_start = position + len(delimiter) + 2
+        headers_end = data.find(b"\r\n\r\n", headers_start)
+        if headers_end == -1:
+            return None, False
+        part_headers = data[headers_start:headers_end]
+        if b"filename=" in part_headers:
+            return None, True
+        next_position = data.find(b"\r\n" + delimiter, headers_end)
+        if next_position == -1:
+            return None, False
+        name = _FIELD_NAME.search(part_headers)
+        if name and name.group(1) == LICENSE_FIELD.encode():
+            return data[headers_end + 4 : next_position].decode("utf-8").strip(), True
+        position = next_position + 2
+    return None, False
+
+
+def _replay(body: bytes, more_body: bool, receive: Receive) -> Receive:
+    """A receive that hands out the peeked body first, then the rest of the stream."""
+    replayed = False
+
+    async def replay_receive() -> Message:
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": more_body}
+        return await receive()
+
+    return replay_receive
@@ -0,0 +1,278 @@
+"""
+Storage backends of the license and public key caches.
+
+With the default `memory` backend every process keeps its own cache, so each worker
+verifies each tenant itself and everything is lost on restart. The `sqlite` backend
+keeps verified licenses and public keys in a file shared by all processes on a host,
+and across restarts. The `redis` backend (needs the `redis` package) shares them
+between hosts too.
+
+    LICENSE_CACHE_BACKEND      memory | sqlite | redis   (default: memory)
+    LICENSE_CACHE_SIZE         max verified licenses kept   (default: 100)
+    LICENSE_CACHE_EVICTION     lru | lfu | fifo   (default: lru)
+    LICENSE_CACHE_PATH         sqlite file   (default: DATA_DIR/license_cache.sqlite3)
+    LICENSE_CACHE_REDIS_URL    (default: redis://localhost:6379/0)
+
+Entries expire after their TTL with every backend. Redis applies its own
+`maxmemory-policy` instead of LICENSE_CACHE_SIZE and LICENSE_CACHE_EVICTION. License
+keys are stored as their SHA-256, never in clear.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+
+from cachetools import FIFOCache, LFUCache, LRUCache
+
+from service_runtime import run_io_bound
+from service_runtime.storage import data_path, ensure_parent_dir
+
+logger = logging.getLogger(__name__)
+
+LICENSE_CACHE_BACKEND = os.getenv("LICENSE_CACHE_BACKEND", "memory")
+LICENSE_CACHE_SIZE = int(os.getenv("LICENSE_CACHE_SIZE", 100))
+LICENSE_CACHE_EVICTION = os.getenv("LICENSE_CACHE_EVICTION", "lru")
+LICENSE_CACHE_PATH = os.getenv("LICENSE_CACHE_PATH", data_path("license_cache.sqlite3"))
+LICENSE_CACHE_REDIS_URL = os.getenv("LICENSE_CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+_EVICTION_POLICIES = ("lru", "lfu", "fifo")
+
+
+def hash_license_key(license_key: str) -> str:
+    """What is stored in place of a license key, in caches and usage records."""
+    return hashlib.sha256(str(license_key).encode("utf-8")).hexdigest()
+
+
+class LicenseStore(ABC):
+    """
+    JSON entries of one namespace ("license", "public_key") with a TTL. A failing
+    backend is logged and reads as a miss, the licensing server stays the source of truth.
+    """
+
+    def __init__(self, namespace: str, maxsize: int, ttl: float):
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+    async def get(self, key: str) -> Optional[dict]:
+        try:
+            return await self._get(key)
+        except Exception as e:
+            logger.warning(f"{self.namespace} cache read failed: {e}")
+            return None
+
+    async def set(self, key: str, value: dict):
+        try:
+            await self._set(key, value)
+        except Exception as e:
+            logger.warning(f"{self.namespace} cache write failed: {e}")
+
+    async def delete(self, key: str):
+        try:
+            await self._delete(key)
+        except Exception as e:
+            logger.warning(f"{self.namespace} cache delete failed: {e}")
+
+    @abstractmethod
+    async def _get(self, key: str) -> Optional[dict]:
+        pass
+
+    @abstractmethod
+    async def _set(self, key: str, value: dict):
+        pass
+
+    @abstractmethod
+    async def _delete(self, key: str):
+        pass
+
+
+class InMemoryLicenseStore(LicenseStore):
+    """Per process cache."""
+
+    _CACHES = {"lru": LRUCache, "lfu": LFUCache, "fifo": FIFOCache}
+
+    def __init__(self, namespace: str, maxsize: int, ttl: float, eviction: str = "lru"):
+        super().__init__(namespace, maxsize, ttl)
+        # key -> (expires at, value)
+        self._entries = self._CACHES[eviction](maxsize=maxsize)
+
+    async def _get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            self._entries.pop(key, None)
+            return None
+        return value
+
+    async def _set(self, key: str, value: dict):
+        self._entries[key] = (time.time() + self.ttl, value)
+
+    async def _delete(self, key: str):
+        self._entries.pop(key, None)
+
+
+class SQLiteLicenseStore(LicenseStore):
+    """Rows in a SQLite file, shared by all processes on the host and kept across restarts."""
+
+    # Entries kept first when the namespace is full
+    _EVICTION_ORDER = {
+        "lru": "accessed_at DESC",
+        "lfu": "hits DESC, accessed_at DESC",
+        "fifo": "created_at DESC",
+    }
+
+    def __init__(
+        self,
+        namespace: str,
+        maxsize: int,
+        ttl: float,
+        eviction: str = "lru",
+        path: str = LICENSE_CACHE_PATH,
+    ):
+        super().__init__(namespace, maxsize, ttl)
+        self._order = self._EVICTION_ORDER[eviction]
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            ensure_parent_dir(path), check_same_thread=False, timeout=30
+        )
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # A cache: losing the last commits on power loss is fine, an fsync per write is not
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS license_cache ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, data TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, created_at REAL NOT NULL, "
+                "accessed_at REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            self._conn.commit()
+
+    def _get_sync(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM license_cache "
+                "WHERE namespace = ? AND key = ? AND expires_at >= ?",
+                (self.namespace, key, now),
+            ).fetchone()
+            if row:
+                self._conn.execute(
+                    "UPDATE license_cache SET accessed_at = ?, hits = hits + 1 "
+                    "WHERE namespace = ? AND key = ?",
+                    (now, self.namespace, key),
+                )
+                self._conn.commit()
+        return row[0] if row else None
+
+    def _set_sync(self, key: str, data: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO license_cache "
+                "(namespace, key, data, expires_at, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                # A refresh keeps the entry's age and hit count for eviction
+                "ON CONFLICT (namespace, key) DO UPDATE SET data = excluded.data, "
+                "expires_at = excluded.expires_at, accessed_at = excluded.accessed_at",
+                (self.namespace, key, data, now + self.ttl, now, now),
+            )
+            self._conn.execute(
+                "DELETE FROM license_cache WHERE namespace = ? AND expires_at < ?",
+                (self.namespace, now),
+            )
+            # Keeps the entry just written and the `maxsize - 1` best others
+            self._conn.execute(
+                "DELETE FROM license_cache WHERE namespace = ? AND key != ? AND key NOT IN ("
+                "SELECT key FROM license_cache WHERE namespace = ? AND key != ? "
+                f"ORDER BY {self._order} LIMIT ?)",
+                (self.namespace, key, self.namespace, key, self.maxsize - 1),
+            )
+            self._conn.commit()
+
+    def _delete_sync(self, key: str):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM license_cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            )
+            self._conn.commit()
+
+    async def _get(self, key: str) -> Optional[dict]:
+        data = await run_io_bound(self._get_sync, key)
+        return json.loads(data) if data else None
+
+    async def _set(self, key: str, value: dict):
+        await run_io_bound(self._set_sync, key, json.dumps(value))
+
+    async def _delete(self, key: str):
+        await run_io_bound(self._delete_sync, key)
+
+
+class RedisLicenseStore(LicenseStore):
+    """Keys with an expiry in Redis, shared by every host using the same server."""
+
+    def __init__(
+        self, namespace: str, maxsize: int, ttl: float, url: str = LICENSE_CACHE_REDIS_URL
+    ):
+        super().__init__(namespace, maxsize, ttl)
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise ImportError(
+                "LICENSE_CACHE_BACKEND=redis needs the `redis` package (pip install redis)"
+            )
+        self._redis = redis.from_url(url)
+        self._prefix = f"lyik:{namespace}:"
+
+    async def _get(self, key: str) -> Optional[dict]:
+        data = await self._redis.get(self._prefix + key)
+        return json.loads(data) if data else None
+
+    async def _set(self, key: str, value: dict):
+        await self._redis.set(
+            self._prefix + key, json.dumps(value), ex=max(1, int(self.ttl))
+        )
+
+    async def _delete(self, key: str):
+        await self._redis.delete(self._prefix + key)
+
+
+def build_license_store(namespace: str, maxsize: int, ttl: float) -> LicenseStore:
+    eviction = LICENSE_CACHE_EVICTION
+    if eviction not in _EVICTION_POLICIES:
+        logger.warning(f"Unknown LICENSE_CACHE_EVICTION {eviction}, using lru")
+        eviction = "lru"
+    if LICENSE_CACHE_BACKEND == "sqlite":
+        return SQLiteLicenseStore(namespace, maxsize, ttl, eviction)
+    if LICENSE_CACHE_BACKEND == "redis":
+        return RedisLicenseStore(namespace, maxsize, ttl)
+    if LICENSE_CACHE_BACKEND != "memory":
+        logger.warning(f"Unknown LICENSE_CACHE_BACKEND {LICENSE_CACHE_BACKEND}, using memory")
+    return InMemoryLicenseStore(namespace, maxsize, ttl, eviction)
+
+
+_stores: Dict[str, LicenseStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_license_store(namespace: str, maxsize: int, ttl: float) -> LicenseStore:
+    """
+    The store of `namespace`, created on first use, i.e. in the serving process and
+    not in a pre-fork master whose SQLite connection would be shared by its children.
+    """
+    store = _stores.get(namespace)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(namespace)
+            if store is None:
+                store = _stores[namespace] = build_license_store(namespace, maxsize, ttl)
+    return store
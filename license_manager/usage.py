@@ -0,0 +1,278 @@
+"""
+Usage metering per license key and service, for billing and quotas.
+
+Requests are counted in memory and the counts are written in batches every
+USAGE_FLUSH_INTERVAL seconds, and on shutdown, instead of one database write per
+request. Every process counts on its own. The sinks add the counts up, so several
+workers, or several servers, can share one sink. License keys are recorded as their
+SHA-256, as in the license cache, never in clear. Counts are billed to the UTC day of
+the request.
+
+    USAGE_SINK              off | sqlite | file | mongo   (default: sqlite)
+    USAGE_SINK_PATH         sqlite database or JSON lines file   (default: DATA_DIR/usage.sqlite3)
+    USAGE_MONGO_URL         (default: MONGO_CONN_URL) needs the `pymongo` package
+    USAGE_FLUSH_INTERVAL    seconds   (default: 60)
+    USAGE_MAX_KEYS          (license key, service, day) entries buffered   (default: 10000)
+
+A full buffer is flushed right away. Counts of new entries arriving while it is full,
+or that a failing sink could not take back, are dropped and logged.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from service_runtime import run_io_bound
+from service_runtime.storage import data_path, ensure_parent_dir
+from .store import hash_license_key
+
+logger = logging.getLogger(__name__)
+
+USAGE_SINK = os.getenv("USAGE_SINK", "sqlite")
+USAGE_SINK_PATH = os.getenv("USAGE_SINK_PATH", data_path("usage.sqlite3"))
+USAGE_MONGO_URL = os.getenv("USAGE_MONGO_URL", os.getenv("MONGO_CONN_URL"))
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", 60))
+USAGE_MAX_KEYS = int(os.getenv("USAGE_MAX_KEYS", 10000))
+
+
+@dataclass
+class UsageRecord:
+    # SHA-256 of the license key, see hash_license_key
+    license_hash: str
+    service: str
+    # UTC date the counts are billed to, YYYY-MM-DD
+    day: str
+    requests: int
+    failures: int
+
+
+# --- Sinks --------------------------------------------------------------------
+
+
+class UsageSink(ABC):
+    @abstractmethod
+    async def write(self, records: List[UsageRecord]):
+        pass
+
+    async def close(self):
+        pass
+
+
+class SQLiteUsageSink(UsageSink):
+    """Daily totals per license key and service, incremented by every flush."""
+
+    def __init__(self, path: str = USAGE_SINK_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            ensure_parent_dir(path), check_same_thread=False, timeout=30
+        )
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS usage ("
+                "license_hash TEXT NOT NULL, service TEXT NOT NULL, day TEXT NOT NULL, "
+                "requests INTEGER NOT NULL, failures INTEGER NOT NULL, "
+                "updated_at REAL NOT NULL, PRIMARY KEY (license_hash, service, day))"
+            )
+            self._conn.commit()
+
+    def _write(self, records: List[UsageRecord]):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO usage "
+                "(license_hash, service, day, requests, failures, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (license_hash, service, day) DO UPDATE SET "
+                "requests = requests + excluded.requests, "
+                "failures = failures + excluded.failures, "
+                "updated_at = excluded.updated_at",
+                [
+                    (r.license_hash, r.service, r.day, r.requests, r.failures, now)
+                    for r in records
+                ],
+            )
+            self._conn.commit()
+
+    async def write(self, records: List[UsageRecord]):
+        await run_io_bound(self._write, records)
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class FileUsageSink(UsageSink):
+    """Appends one JSON line per record, for log shippers to pick up."""
+
+    def __init__(self, path: str = USAGE_SINK_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _write(self, records: List[UsageRecord]):
+        lines = "".join(json.dumps(asdict(r)) + "\n" for r in records)
+        with self._lock, open(ensure_parent_dir(self.path), "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    async def write(self, records: List[UsageRecord]):
+        await run_io_bound(self._write, records)
+
+
+class MongoUsageSink(UsageSink):
+    """Daily totals in the `usage` collection of the lyikservices database."""
+
+    def __init__(self, url: Optional[str] = USAGE_MONGO_URL):
+        try:
+            import pymongo
+        except ImportError:
+            raise ImportError("USAGE_SINK=mongo needs the `pymongo` package (pip install pymongo)")
+        self._pymongo = pymongo
+        self._client = pymongo.MongoClient(host=url)
+        self._coll = self._client["lyikservices"]["usage"]
+
+    def _write(self, records: List[UsageRecord]):
+        self._coll.bulk_write(
+            [
+                self._pymongo.UpdateOne(
+                    {"license_hash": r.license_hash, "service": r.service, "day": r.day},
+                    {
+                        "$inc": {"requests": r.requests, "failures": r.failures},
+                        "$set": {"updated_at": datetime.now(timezone.utc)},
+                    },
+                    upsert=True,
+                )
+                for r in records
+            ],
+            ordered=False,
+        )
+
+    async def write(self, records: List[UsageRecord]):
+        await run_io_bound(self._write, records)
+
+    async def close(self):
+        self._client.close()
+
+
+def build_usage_sink() -> Optional[UsageSink]:
+    if USAGE_SINK == "sqlite":
+        return SQLiteUsageSink()
+    if USAGE_SINK == "file":
+        return FileUsageSink()
+    if USAGE_SINK == "mongo":
+        return MongoUsageSink()
+    return None
+
+
+# --- Meter --------------------------------------------------------------------
+
+
+class UsageMeter:
+    def __init__(
+        self,
+        sink: Optional[UsageSink],
+        interval: float = USAGE_FLUSH_INTERVAL,
+        max_keys: int = USAGE_MAX_KEYS,
+    ):
+        self.sink = sink
+        self.interval = interval
+        self.max_keys = max_keys
+        # (license hash, service, day) -> [requests, failures]
+        self._counts: Dict[Tuple[str, str, str], List[int]] = {}
+        self._dropped = 0
+        self._full = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, license_key: str, service: str, ok: bool = True):
+        """Counts one request. Never blocks, never raises."""
+        if self.sink is None or not license_key:
+            return
+        key = (
+            hash_license_key(license_key),
+            getattr(service, "value", service),
+            datetime.now(timezone.utc).strftime("%Y-%m-%d"),
+        )
+        counts = self._counts.get(key)
+        if counts is None:
+            if len(self._counts) >= self.max_keys:
+                self._full.set()
+                self._dropped += 1
+                return
+            counts = self._counts[key] = [0, 0]
+        counts[0] += 1
+        if not ok:
+            counts[1] += 1
+
+    async def start(self):
+        if self.sink is not None and self._task is None:
+            self._task = asyncio.create_task(self._run(), name="usage-flusher")
+
+    async def stop(self):
+        """Stops the periodic flush and writes what is left."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.sink is not None:
+            await self.flush()
+            await self.sink.close()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self.flush()
+
+    async def flush(self):
+        async with self._flush_lock:
+            counts, self._counts = self._counts, {}
+            dropped, self._dropped = self._dropped, 0
+            if dropped:
+                logger.warning(f"Usage buffer was full, dropped {dropped} requests")
+            if not counts:
+                return
+            records = [
+                UsageRecord(key, service, day, requests, failures)
+                for (key, service, day), (requests, failures) in counts.items()
+            ]
+            try:
+                await self.sink.write(records)
+            except Exception as e:
+                logger.warning(f"Usage flush of {len(records)} records failed: {e}")
+                self._restore(counts)
+
+    def _restore(self, counts: Dict[Tuple[str, str, str], List[int]]):
+        """Puts the counts of a failed flush back for the next one, as far as they fit."""
+        lost = 0
+        for key, (requests, failures) in counts.items():
+            current = self._counts.get(key)
+            if current is None:
+                if len(self._counts) >= self.max_keys:
+                    lost += requests
+                    continue
+                current = self._counts[key] = [0, 0]
+            current[0] += requests
+            current[1] += failures
+        if lost:
+            logger.warning(f"Usage buffer is full, dropped {lost} requests")
+
+
+_usage_meter: Optional[UsageMeter] = None
+
+
+def get_usage_meter() -> UsageMeter:
+    global _usage_meter
+    if _usage_meter is None:
+        _usage_meter = UsageMeter(build_usage_sink())
+    return _usage_meter
@@ -1 +1,2 @@
-from ._base_node import LLMInvokerBaseNode
\ No newline at end of file
+from ._base_node import LLMInvokerBaseNode
+from .timed_model import TimedModel
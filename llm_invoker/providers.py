@@ -0,0 +1,83 @@
+"""
+Process wide LLM models and their HTTP clients.
+
+The OpenAI and Gemini models, and the fallback model over both, are built once and
+shared by every node and agent. Each provider gets one pooled `httpx.AsyncClient`, so
+LLM calls reuse warm (TLS) connections instead of opening new ones per request. `.env`
+is read once, before the first model reads its API key.
+
+    LLM_CONNECT_TIMEOUT     seconds   (default: 5)
+    LLM_READ_TIMEOUT        seconds   (default: 600)
+    LLM_MAX_CONNECTIONS     per provider   (default: 100)
+    LLM_MAX_KEEPALIVE       idle connections kept open per provider   (default: 20)
+    LLM_KEEPALIVE_EXPIRY    seconds an idle connection is kept   (default: 60)
+"""
+
+import os
+from functools import lru_cache
+from typing import Dict
+
+import httpx
+from dotenv import load_dotenv
+from pydantic_ai.models.fallback import FallbackModel
+from pydantic_ai.models.gemini import GeminiModel
+from pydantic_ai.models.openai import OpenAIModel
+from pydantic_ai.providers.google_gla import GoogleGLAProvider
+from pydantic_ai.providers.openai import OpenAIProvider
+
+from .timed_model import TimedModel
+
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 5))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", 600))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 100))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", 20))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", 60))
+
+# provider -> client. Not shared between providers: the Gemini provider sets its
+# base url and API key header on the client.
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+@lru_cache(maxsize=None)
+def load_env():
+    load_dotenv()
+
+
+def get_http_client(provider: str) -> httpx.AsyncClient:
+    client = _clients.get(provider)
+    if client is None or client.is_closed:
+        client = _clients[provider] = httpx.AsyncClient(
+            timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return client
+
+
+@lru_cache(maxsize=None)
+def get_openai_model() -> OpenAIModel:
+    load_env()
+    return OpenAIModel(
+        model_name="gpt-4o",
+        provider=OpenAIProvider(http_client=get_http_client("openai")),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_gemini_model() -> GeminiModel:
+    load_env()
+    return GeminiModel(
+        model_name="gemini-2.0-flash",
+        provider=GoogleGLAProvider(http_client=get_http_client("google-gla")),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_fallback_model() -> FallbackModel:
+    """OpenAI first, Gemini when it fails. Each provider's latency is recorded."""
+    return FallbackModel(
+        TimedModel(get_openai_model()), TimedModel(get_gemini_model())
+    )
@@ -0,0 +1,17 @@
+from typing import Any
+
+from pydantic_ai.messages import ModelResponse
+from pydantic_ai.models.wrapper import WrapperModel
+
+from service_runtime.metrics import observe_llm
+
+
+class TimedModel(WrapperModel):
+    """
+    Records the latency of every request to the wrapped model, labelled with its model
+    name. Wrap the individual models inside a FallbackModel, so each provider is timed.
+    """
+
+    async def request(self, *args: Any, **kwargs: Any) -> ModelResponse:
+        with observe_llm(self.wrapped.model_name):
+            return await self.wrapped.request(*args, **kwargs)
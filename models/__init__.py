@@ -1 +1,2 @@
-from .response_models import ResponseStatusEnum, StandardResponse
\ No newline at end of file
+from .response_models import ResponseStatusEnum, StandardResponse
+from .job_models import Job, JobStatusEnum
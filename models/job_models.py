@@ -0,0 +1,23 @@
+from enum import Enum
+from pydantic import BaseModel
+from typing import Optional
+from .response_models import StandardResponse
+
+
+class JobStatusEnum(str, Enum):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+
+
+class Job(BaseModel):
+    job_id: str
+    service_name: str
+    status: JobStatusEnum = JobStatusEnum.queued
+    stage: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[StandardResponse] = None
+    error: Optional[str] = None
@@ -1,6 +1,6 @@
 from enum import Enum
 from pydantic import BaseModel
-from typing import Optional, Any
+from typing import Optional, Any, Dict
 
 class ResponseStatusEnum(str, Enum):
     success = "success"
@@ -10,3 +10,8 @@ class StandardResponse(BaseModel):
     status: ResponseStatusEnum
     message: str
     result: Optional[Any] = None
+    metadata: Optional[Dict[str, Any]] = None
+
+    def add_metadata(self, **values: Any):
+        """Merges serving details (queue wait, cache hits, ...) into `metadata`."""
+        self.metadata = {**(self.metadata or {}), **values}
@@ -6,7 +6,8 @@ from ..models import document_models, DocumentTypesEnum
 import json
 from pydantic import BaseModel, ValidationError
 import re
-from typing import List, Dict, Type
+from functools import lru_cache
+from typing import List, Dict, Type, Union
 from langgraph.graph import StateGraph
 from .llm_invoke import query_llm
 from .utils import (
@@ -14,9 +15,16 @@ from .utils import (
     remove_newline_characters,
     does_text_match_patterns,
 )
-from ..nodes import DOCUMENT_NODE_PATTERN_MAPPING, KNOWN_DOCUMENT_NODE_MAPPING, BaseNode
+from ..nodes import (
+    DOCUMENT_NODE_PATTERN_MAPPING,
+    KNOWN_DOCUMENT_NODE_MAPPING,
+    BaseNode,
+    get_document_node,
+)
 
-from .ocr_handler import process_file
+from .ocr_handler import ocr_documents
+from service_runtime import report_stage, run_io_bound, InputFile
+from service_runtime.metrics import observe_stage
 
 from service_handlers.pincode_service import get_pincode_details
 from service_handlers.pincode_service.pin_code_models import PincodeDetails
@@ -29,19 +37,21 @@ async def extract_text_from_documents(
     Extract text from one or more documents (images or PDFs) using MIME routing.
     Keeps the original signature and behavior of setting state.extracted_text / state.error.
     """
+    report_stage("ocr")
     aggregated_texts: List[str] = []
     errors: List[str] = []
 
     try:
-        for document_path in state.image_path:
-            try:
-                text = process_file(document_path)
-                if text:
+        with observe_stage("agent_pipeline", "ocr"):
+            # Files (and PDF images) are OCR'd concurrently, texts stay in upload order
+            results = await ocr_documents(state.image_path)
+            for document_path, text in zip(state.image_path, results):
+                if isinstance(text, Exception):
+                    msg = f"OCR failed for {document_path}: {text}"
+                    # logger.error(msg)
+                    errors.append(msg)
+                elif text:
                     aggregated_texts.append(text)
-            except Exception as e:
-                msg = f"OCR failed for {document_path}: {e}"
-                # logger.error(msg)
-                errors.append(msg)
 
         state.extracted_text = "\n\n".join(aggregated_texts).strip()
         if errors and not getattr(state, "error", None):
@@ -104,14 +114,20 @@ async def identify_validate_and_extract_document_with_pattern(
     if state.error:
         return state  # Skip if there was an error in OCR
 
+    report_stage("classify_and_extract")
     # Pydantic Model Scehmas for available documents
     data = None
     document_type = None
-    for pattern_list, DocumentNodeClass, document_type in DOCUMENT_NODE_PATTERN_MAPPING:
-        if does_text_match_patterns(state.extracted_text, pattern_list):
-            node: BaseNode = DocumentNodeClass()
+    matched = None
+    with observe_stage("agent_pipeline", "classify"):
+        for pattern_list, DocumentNodeClass, document_type in DOCUMENT_NODE_PATTERN_MAPPING:
+            if does_text_match_patterns(state.extracted_text, pattern_list):
+                matched = DocumentNodeClass
+                break
+    if matched is not None:
+        with observe_stage("agent_pipeline", "llm_extract"):
+            node: BaseNode = get_document_node(matched)
             data: BaseModel = await node.extract(ocr_text=state.extracted_text)
-            break
 
     if data is None:
         state.error = f"No Document Node found for data."
@@ -173,6 +189,13 @@ async def validate_document_data(
     if state.error:
         return state  # Skip processing if an error occurred
 
+    report_stage("validate")
+    with observe_stage("agent_pipeline", "validate"):
+        # The pin code lookup reads the CSV when it is not loaded yet, off the loop
+        return await run_io_bound(_validate_document_data, state)
+
+
+def _validate_document_data(state: DocumentProcessingState) -> DocumentProcessingState:
     if state.document_type not in document_models:
         state.error = f"Unrecognized document type: {state.document_type}"
         return state
@@ -226,6 +249,15 @@ def build_langraph_pipeline():
     return graph.compile()
 
 
+@lru_cache(maxsize=None)
+def get_langraph_pipeline():
+    """
+    The compiled pipeline, built on first use. A compiled graph keeps no per-run
+    state, so concurrent requests share it.
+    """
+    return build_langraph_pipeline()
+
+
 # # LangGraph Workflow
 # def build_langraph_pipeline():
 #     """Builds the LangGraph workflow for document processing."""
@@ -247,9 +279,9 @@ def build_langraph_pipeline():
 
 
 # Invoking Document Processing Agent pipeline
-async def process_document(image_path: List[str]) -> Dict:
+async def process_document(image_path: List[Union[str, InputFile]]) -> Dict:
     """Runs the LangGraph pipeline for a single document."""
-    pipeline = build_langraph_pipeline()
+    pipeline = get_langraph_pipeline()
     state = DocumentProcessingState(image_path=image_path)
     return await pipeline.ainvoke(state)
 
@@ -276,6 +308,12 @@ def build_langraph_known_pipeline():
     return graph.compile()
 
 
+@lru_cache(maxsize=None)
+def get_langraph_known_pipeline():
+    """The compiled known-doc pipeline, built on first use and shared like the one above."""
+    return build_langraph_known_pipeline()
+
+
 def _coerce_document_type(value: str):
     try:
         return DocumentTypesEnum(value)
@@ -300,6 +338,7 @@ async def extract_known_document_node(
         state.error = "document_type is required for known-document extraction."
         return state
 
+    report_stage("extract")
     NodeClass: Type[BaseNode] | None = KNOWN_DOCUMENT_NODE_MAPPING.get(
         state.document_type
     )
@@ -308,8 +347,9 @@ async def extract_known_document_node(
         return state
 
     try:
-        node = NodeClass()
-        model_obj: BaseModel = await node.extract(ocr_text=state.extracted_text)
+        with observe_stage("agent_pipeline", "llm_extract"):
+            node = get_document_node(NodeClass)
+            model_obj: BaseModel = await node.extract(ocr_text=state.extracted_text)
         state.extracted_data = model_obj.model_dump()
     except Exception as e:
         state.error = f"Known-document extract failed: {e}"
@@ -317,7 +357,9 @@ async def extract_known_document_node(
     return state
 
 
-async def process_known_document(image_path: List[str], ocr_document_type: str) -> Dict:
+async def process_known_document(
+    image_path: List[Union[str, InputFile]], ocr_document_type: str
+) -> Dict:
     """
     Entry for known-doc flow using a LangGraph pipeline.
     """
@@ -330,6 +372,6 @@ async def process_known_document(image_path: List[str], ocr_document_type: str)
 
     state.document_type = coerced
 
-    pipeline = build_langraph_known_pipeline()
+    pipeline = get_langraph_known_pipeline()
     # Graph will: OCR → Extract Known → Validate
     return await pipeline.ainvoke(state)
@@ -1,12 +1,13 @@
-import httpx
 from enum import Enum
 from google import genai
 from google.genai import types
 from .utils import remove_newline_characters
 import os
-from dotenv import load_dotenv
+from functools import lru_cache
+from llm_invoker.providers import get_http_client, load_env
+from service_runtime.metrics import observe_llm
 
-load_dotenv()
+load_env()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 class LLMS(str, Enum):
@@ -27,11 +28,17 @@ async def query_llm(prompt: str, llm_type: LLMS = LLMS.gemini) -> str:
     return response
 
 
-async def query_gemini(prompt: str) -> str:
-    client = genai.Client(
+@lru_cache(maxsize=None)
+def get_genai_client() -> genai.Client:
+    """One client, and its connection pool, for all Gemini queries."""
+    return genai.Client(
         api_key=GEMINI_API_KEY,
     )
 
+
+async def query_gemini(prompt: str) -> str:
+    client = get_genai_client()
+
     model = "gemini-2.0-flash"
     # model = "gemini-2.0-flash-lite"
     # model = "gemini-2.0-pro-exp-02-05"d
@@ -54,13 +61,14 @@ async def query_gemini(prompt: str) -> str:
 
     response = ""
 
-    for chunk in client.models.generate_content_stream(
-        model=model,
-        contents=contents,
-        config=generate_content_config,
-    ):
-        print(chunk.text, end="")
-        response += chunk.text
+    with observe_llm(model):
+        for chunk in client.models.generate_content_stream(
+            model=model,
+            contents=contents,
+            config=generate_content_config,
+        ):
+            print(chunk.text, end="")
+            response += chunk.text
 
     cleaned_response = remove_newline_characters(text=response).strip()
     return cleaned_response
@@ -69,19 +77,20 @@ async def query_gemini(prompt: str) -> str:
 async def query_ollama(prompt: str) -> str:
     """Query Ollama's locally running model."""
     try:
-        async with httpx.AsyncClient() as client:
+        client = get_http_client("ollama")
+        with observe_llm("qwen2.5"):
             response = await client.post(
                 "http://localhost:11434/api/generate",  # Ollama's API
                 json={"model": "qwen2.5", "prompt": prompt, "stream": False},
                 timeout=60,
             )
-            response_data = response.json()
-
-            if "response" in response_data:
-                response = response_data["response"]
-                cleaned_response = remove_newline_characters(text=response).strip()
-                return cleaned_response
-            else:
-                return f"Error: Unexpected response format {response_data}"
+        response_data = response.json()
+
+        if "response" in response_data:
+            response = response_data["response"]
+            cleaned_response = remove_newline_characters(text=response).strip()
+            return cleaned_response
+        else:
+            return f"Error: Unexpected response format {response_data}"
     except Exception as e:
         return f"Error in LLM query: {str(e)}"
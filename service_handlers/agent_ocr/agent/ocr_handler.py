@@ -1,25 +1,49 @@
 # import pytesseract
 # --- imports -----------------------------------------------------------------
+import asyncio
+import contextlib
 import io
 import logging
-import mimetypes
+import os
 import tempfile
-from pathlib import Path
-from typing import List, Optional
+from dataclasses import dataclass, field
+from enum import Enum
+from functools import lru_cache
+from typing import Iterator, List, Optional, Sequence, Union
 
-import filetype  # pip install filetype
 import fitz  # pip install pymupdf
 from PIL import Image
-from paddleocr import PaddleOCR
 
 from paddleocr.ppocr.utils.logging import get_logger
 
 # New (for in-memory OCR)
 import numpy as np  # pip install numpy
-import cv2          # pip install opencv-python
+
+from service_handlers.ocr_engine import get_ocr_engine, preprocess, to_bgr
+from service_handlers.ocr_engine.preprocess import OCR_MAX_SIDE
+from service_runtime import InputFile, as_input_file, run_cpu_bound, run_io_bound
 
 # --- feature flags ------------------------------------------------------------
 SUPPORT_PDF_IMAGES = False  # set False to disable OCR for images inside PDFs
+# Max files / PDF images of one request OCR'd at the same time on the CPU pool, so one
+# large PDF cannot take all the workers
+OCR_REQUEST_PARALLELISM = int(os.getenv("OCR_REQUEST_PARALLELISM", 2))
+# Pages of a PDF read ahead of the page being OCR'd, bounds the images held in memory
+OCR_PDF_READ_AHEAD = int(os.getenv("OCR_PDF_READ_AHEAD", 2))
+
+
+class PdfImageModeEnum(str, Enum):
+    render = "render"  # rasterise the pages that need OCR at OCR_PDF_DPI
+    embedded = "embedded"  # OCR each embedded image at its native resolution
+
+
+# How the images of PDF pages are OCR'd, when SUPPORT_PDF_IMAGES is set
+OCR_PDF_IMAGE_MODE = PdfImageModeEnum(os.getenv("OCR_PDF_IMAGE_MODE", "render"))
+OCR_PDF_DPI = int(os.getenv("OCR_PDF_DPI", 200))
+# Pages with at least this many characters of text layer are not rendered for OCR
+OCR_PDF_MIN_TEXT_CHARS = int(os.getenv("OCR_PDF_MIN_TEXT_CHARS", 50))
+# Embedded images with a side below this many px (logos, rules, bullets) are ignored
+OCR_PDF_MIN_IMAGE_SIDE = int(os.getenv("OCR_PDF_MIN_IMAGE_SIDE", 64))
 
 logger = get_logger()
 logger.setLevel(logging.ERROR)
@@ -35,32 +59,40 @@ logger.setLevel(logging.ERROR)
 
 class TextExtractor:
     """
-    Internally initialize PaddleOCR once and reuse it.
+    OCR through the batched PaddleOCR engine, shared by concurrent calls.
     """
 
     def __init__(self):
         # minimize console noise (match your original intent)
         logger.setLevel(logging.ERROR)
-        # Initialize OCR once
-        self.ocr = PaddleOCR(
-            use_angle_cls=True, lang="en"
-        )  # use_gpu=False by default if no GPU
-
-    def extract_text(self, img: str) -> str:
+        self.engine = get_ocr_engine()
+
+    def extract_text(
+        self,
+        img: Union[str, np.ndarray],
+        name: str = "",
+        *,
+        max_side: int = OCR_MAX_SIDE,
+    ) -> str:
         """
-        Image OCR with the same signature as before.
+        Image OCR for a path or an already decoded BGR array. An array is preprocessed
+        first: cropped and turned to grayscale as configured, downscaled to `max_side`.
+        `max_side=0` keeps the size, e.g. of a page rendered at a chosen DPI.
         Keeps a light confidence filter and concatenates lines.
         """
+        name = name or (img if isinstance(img, str) else "<in-memory image>")
         try:
-            ret = self.ocr.ocr(img=img, det=True, rec=True)
+            if isinstance(img, np.ndarray):
+                img, _ = preprocess(img, max_side=max_side)
+            lines = self.engine.ocr_lines(img)
         except Exception as e:
-            logger.error(f"PaddleOCR failed on image {img}: {e}")
+            logger.error(f"PaddleOCR failed on image {name}: {e}")
             return ""
 
         full_text = []
         try:
-            if ret and ret[0]:
-                for line in ret[0]:
+            if lines:
+                for line in lines:
                     # expected: (box, (text, score))
                     _, (text, score) = line
                     if (
@@ -70,87 +102,108 @@ class TextExtractor:
                     ):
                         full_text.append(text.strip())
         except Exception as e:
-            logger.error(f"OCR parse error for image {img}: {e}")
+            logger.error(f"OCR parse error for image {name}: {e}")
 
         return "\n".join(full_text)
 
 
-text_extractor = TextExtractor()
+@lru_cache(maxsize=None)
+def get_text_extractor() -> TextExtractor:
+    """The OCR engine, shared with masking, loads its models on first use."""
+    return TextExtractor()
 
 
 # --- PDF helpers --------------------------------------------------------------
 
-def _extract_text_from_pdf_bytes(pdf_bytes: bytes) -> str:
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    try:
-        texts: List[str] = []
-        for page in doc:
-            t = page.get_text("text")
-            if t and t.strip():
-                texts.append(t.strip())
-        return "\n".join(texts).strip()
-    finally:
-        doc.close()
 
+@dataclass
+class PdfPage:
+    """
+    The text layer of a page and what to OCR of it: its embedded images, still
+    encoded, or the page rendered to a BGR array.
+    """
+
+    number: int
+    text: str
+    images: List[Union[bytes, np.ndarray]] = field(default_factory=list)
 
-def _pdf_has_images(pdf_bytes: bytes) -> bool:
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    try:
-        for page in doc:
-            if page.get_images(full=True):
-                return True
-        return False
-    finally:
-        doc.close()
 
+def _open_pdf(source: InputFile) -> fitz.Document:
+    if source.in_memory:
+        return fitz.open(stream=source.read_bytes(), filetype="pdf")
+    with source.as_path() as path:  # a spilled upload, opened in place
+        return fitz.open(path)
 
-def _extract_images_from_pdf_bytes(pdf_bytes: bytes) -> List[Image.Image]:
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    images: List[Image.Image] = []
+
+def _render_page(page: fitz.Page, dpi: int = OCR_PDF_DPI) -> np.ndarray:
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csRGB, alpha=False)
+    rgb = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, 3)
+    return np.ascontiguousarray(rgb[:, :, ::-1])
+
+
+def iter_pdf_pages(
+    pdf_path: Union[str, InputFile],
+    *,
+    images: bool = True,
+    mode: PdfImageModeEnum = OCR_PDF_IMAGE_MODE,
+) -> Iterator[PdfPage]:
+    """
+    Opens the PDF once and yields its pages one at a time. Only the images of the
+    current page are held, so memory does not grow with the page count.
+
+    With `images`, embedded images smaller than OCR_PDF_MIN_IMAGE_SIDE are ignored.
+    In render mode a page is rendered at OCR_PDF_DPI when it shows an image and has
+    less than OCR_PDF_MIN_TEXT_CHARS of text layer, so a scanned page costs the same
+    whatever the resolution of its scan. In embedded mode its images are extracted.
+    """
+    doc = _open_pdf(as_input_file(pdf_path))
     try:
         for page in doc:
-            for img in page.get_images(full=True):
-                xref = img[0]
-                base = doc.extract_image(xref)
-                img_bytes = base.get("image")
-                if not img_bytes:
-                    continue
-                try:
-                    pil_img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-                    images.append(pil_img)
-                except Exception as e:
-                    logger.error(f"Failed to decode embedded image (xref={xref}): {e}")
+            text = (page.get_text("text") or "").strip()
+            page_images: List[Union[bytes, np.ndarray]] = []
+            if images:
+                # (xref, smask, width, height, ...)
+                shown = [
+                    img
+                    for img in page.get_images(full=True)
+                    if min(img[2], img[3]) >= OCR_PDF_MIN_IMAGE_SIDE
+                ]
+                if mode == PdfImageModeEnum.render:
+                    if shown and len(text) < OCR_PDF_MIN_TEXT_CHARS:
+                        page_images.append(_render_page(page))
+                else:
+                    for img in shown:
+                        img_bytes = doc.extract_image(img[0]).get("image")
+                        if img_bytes:
+                            page_images.append(img_bytes)
+            yield PdfPage(page.number, text, page_images)
     finally:
         doc.close()
-    return images
 
 
-def ocr_text_only_pdf(pdf_bytes: bytes) -> str:
-    """Extract copyable text from textual PDFs (fast, no image OCR)."""
-    return _extract_text_from_pdf_bytes(pdf_bytes)
+def _join_pdf_texts(texts: List[str], image_texts: List[str]) -> str:
+    """The text layers of all pages first, then the OCR text of the images."""
+    text_part = "\n".join(t for t in texts if t).strip()
+    return "\n".join(t for t in [text_part] + image_texts if t).strip()
 
 
 # --- In-memory OCR helpers (NumPy / OpenCV) ----------------------------------
 
-def _pil_to_cv_bgr(pil_img: Image.Image):
-    """Convert PIL RGB image to OpenCV BGR ndarray."""
-    return cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
-
 def _ocr_pil_image(pil_img: Image.Image) -> str:
     """
     OCR a PIL image without writing to disk by passing a NumPy array (BGR) to PaddleOCR.
     """
     try:
-        arr_bgr = _pil_to_cv_bgr(pil_img)
-        ret = text_extractor.ocr.ocr(img=arr_bgr, det=True, rec=True)
+        arr_bgr, _ = preprocess(to_bgr(pil_img))
+        ret = get_text_extractor().engine.ocr_lines(arr_bgr)
     except Exception as e:
         logger.error(f"In-memory OCR failed: {e}")
         return ""
 
     lines = []
     try:
-        if ret and ret[0]:
-            for line in ret[0]:
+        if ret:
+            for line in ret:
                 _, (text, score) = line
                 if (
                     isinstance(text, str)
@@ -164,81 +217,140 @@ def _ocr_pil_image(pil_img: Image.Image) -> str:
     return "\n".join(lines)
 
 
-def ocr_mixed_pdf(pdf_bytes: bytes) -> str:
-    """
-    Extract text layer (if any) + OCR any embedded raster images.
-    Uses in-memory OCR (NumPy) for images to avoid temp files.
-    """
-    text_part = _extract_text_from_pdf_bytes(pdf_bytes)
-    images = _extract_images_from_pdf_bytes(pdf_bytes)
+def _ocr_image_bytes(img_bytes: bytes) -> str:
+    """OCR of one encoded image, e.g. an image embedded in a PDF."""
+    try:
+        pil_img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
+    except Exception as e:
+        logger.error(f"Failed to decode embedded image: {e}")
+        return ""
+    return _ocr_pil_image(pil_img)
 
-    image_texts: List[str] = []
-    for pil_image in images:
-        try:
-            image_texts.append(_ocr_pil_image(pil_image))
-        except Exception as e:
-            logger.error(f"Image OCR in mixed PDF failed: {e}")
 
-    combined = "\n".join([t for t in [text_part] + image_texts if t])
-    return combined.strip()
+def _ocr_pdf_image(image: Union[bytes, np.ndarray]) -> str:
+    """OCR of an image of a PdfPage, an embedded image or the rendered page."""
+    if isinstance(image, bytes):
+        return _ocr_image_bytes(image)
+    # Cropped and turned to grayscale like any image, but rendered at OCR_PDF_DPI,
+    # already the size to OCR at
+    return get_text_extractor().extract_text(image, name="<rendered page>", max_side=0)
 
 
-def ocr_pdf(pdf_path: str, *, support_images: bool = SUPPORT_PDF_IMAGES) -> str:
-    """Detect PDF type (text-only or mixed) and run the correct pipeline."""
+def ocr_pdf(
+    pdf_path: Union[str, InputFile], *, support_images: bool = SUPPORT_PDF_IMAGES
+) -> str:
+    """
+    Text layer of a PDF, plus the OCR text of its embedded images when support_images
+    is set. Page by page, in a single pass over the document.
+    """
     logger.info(f"Processing PDF: {pdf_path}")
-    with open(pdf_path, "rb") as f:
-        pdf_bytes = f.read()
-
+    texts: List[str] = []
+    image_texts: List[str] = []
     try:
-        if not support_images:
-            # Always return only the copyable text layer; no image OCR even if images exist.
-            return ocr_text_only_pdf(pdf_bytes)
-
-        # Default behavior (support_images=True): original flow
-        if _pdf_has_images(pdf_bytes):
-            logger.info("Detected images/text — running mixed OCR pipeline...")
-            return ocr_mixed_pdf(pdf_bytes)
-        else:
-            logger.info("Detected textual PDF — running text-only extraction...")
-            return ocr_text_only_pdf(pdf_bytes)
+        for page in iter_pdf_pages(pdf_path, images=support_images):
+            texts.append(page.text)
+            for image in page.images:
+                image_texts.append(_ocr_pdf_image(image))
     except Exception as e:
         logger.error(f"PDF OCR failed for {pdf_path}: {e}")
         return ""
+    return _join_pdf_texts(texts, image_texts)
 
 
 # --- Image vs PDF router ------------------------------------------------------
 
-def process_file(file_path: str, *, support_images: bool = SUPPORT_PDF_IMAGES) -> str:
+async def ocr_documents(
+    files: Sequence[Union[str, InputFile]],
+    *,
+    support_images: bool = SUPPORT_PDF_IMAGES,
+    parallelism: int = OCR_REQUEST_PARALLELISM,
+) -> List[Union[str, Exception]]:
     """
-    Detect file type via magic bytes (fallback to extension) and run the right pipeline.
-    Signature matches your proposal. The support_images flag controls PDF image OCR.
+    OCR of several files on the CPU pool, concurrently. PDFs are streamed: their pages
+    are read one at a time and the images of a page are OCR'd while the next pages are
+    read, with at most OCR_PDF_READ_AHEAD pages of a PDF held at once. At most
+    `parallelism` OCR calls of this request run at the same time. Returns the text of
+    each file in input order, or the exception its OCR raised.
     """
-    path = Path(file_path)
+    limit = asyncio.Semaphore(max(1, parallelism))
 
-    # 1) Magic bytes
-    mime: Optional[str] = None
-    try:
-        kind = filetype.guess(str(path))
-        if kind:
-            mime = kind.mime
-            logger.info(f"[magic] MIME: {mime}")
-    except Exception as e:
-        logger.warning(f"filetype.guess failed: {e}")
+    async def cpu(func, *args, **kwargs):
+        # Only the leaf calls take a slot, a file waiting for its pages holds none
+        async with limit:
+            return await run_cpu_bound(func, *args, **kwargs)
 
-    # 2) Fallback to extension
-    if not mime:
-        mime, _ = mimetypes.guess_type(str(path))
-        logger.info(f"[ext] MIME: {mime}")
+    async def ocr_page(page: PdfPage, read_ahead: asyncio.Semaphore) -> List[str]:
+        try:
+            image_texts = await asyncio.gather(
+                *(cpu(_ocr_pdf_image, img) for img in page.images),
+                return_exceptions=True,
+            )
+        finally:
+            read_ahead.release()
+        texts = []
+        for text in image_texts:
+            if isinstance(text, Exception):
+                logger.error(f"Image OCR in mixed PDF failed: {text}")
+                continue
+            texts.append(text)
+        return texts
+
+    async def ocr_streamed_pdf(source: InputFile) -> str:
+        # The document is read on the I/O pool, one page per call, never concurrently
+        pages = iter_pdf_pages(source)
+        read_ahead = asyncio.Semaphore(max(1, OCR_PDF_READ_AHEAD))
+        texts: List[str] = []
+        tasks: List[asyncio.Task] = []
+        try:
+            while True:
+                await read_ahead.acquire()
+                page = await run_io_bound(next, pages, None)
+                if page is None:
+                    break
+                texts.append(page.text)
+                tasks.append(asyncio.ensure_future(ocr_page(page, read_ahead)))
+            image_texts = await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            # When cancelled mid-page the generator still runs, it is closed once collected
+            with contextlib.suppress(ValueError):
+                await run_io_bound(pages.close)
+        return _join_pdf_texts(texts, [t for page in image_texts for t in page])
+
+    async def ocr_one(file: Union[str, InputFile]) -> str:
+        source = as_input_file(file)
+        if not (support_images and source.mime == "application/pdf"):
+            return await cpu(process_file, source, support_images=support_images)
+        return await ocr_streamed_pdf(source)
+
+    return await asyncio.gather(*(ocr_one(f) for f in files), return_exceptions=True)
+
+
+def process_file(
+    file_path: Union[str, InputFile], *, support_images: bool = SUPPORT_PDF_IMAGES
+) -> str:
+    """
+    Detect file type via magic bytes (fallback to extension) and run the right pipeline.
+    Accepts a path or an in-memory InputFile. The support_images flag controls PDF image OCR.
+    """
+    source = as_input_file(file_path)
+
+    mime: Optional[str] = source.mime
+    logger.info(f"MIME: {mime}")
 
     if not mime:
-        raise ValueError(f"Could not detect MIME type for file: {file_path}")
+        raise ValueError(f"Could not detect MIME type for file: {source.filename}")
 
     if mime.startswith("image/"):
         logger.info("Detected Image → running image OCR")
-        return text_extractor.extract_text(str(path))
+        image = source.to_ndarray()
+        if image is None:
+            raise ValueError(f"Could not decode image: {source.filename}")
+        return get_text_extractor().extract_text(image, name=source.filename)
 
     if mime == "application/pdf":
         logger.info("Detected PDF → running PDF OCR")
-        return ocr_pdf(str(path), support_images=support_images)
+        return ocr_pdf(source, support_images=support_images)
 
     raise ValueError(f"Unsupported MIME type: {mime}")
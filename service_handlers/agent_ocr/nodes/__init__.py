@@ -1,3 +1,4 @@
+from functools import lru_cache
 from typing import List, Tuple, Dict, Type
 from ._base_node import BaseNode
 from ..models import DocumentTypesEnum
@@ -75,3 +76,12 @@ KNOWN_DOCUMENT_NODE_MAPPING: Dict[DocumentTypesEnum, Type[BaseNode]] = {
     DocumentTypesEnum.travel_insurance: TravelInsuranceNode,
     DocumentTypesEnum.accommodation_booking: AccommodationBookingNode
 }
+
+
+@lru_cache(maxsize=None)
+def get_document_node(node_class: Type[BaseNode]) -> BaseNode:
+    """
+    One instance per node class, i.e. per document type of the mappings above, shared
+    by all requests. A pydantic-ai Agent keeps no per-run state.
+    """
+    return node_class()
@@ -1,21 +1,18 @@
 # base_node.py
 from abc import ABC, abstractmethod
-from dotenv import load_dotenv
 # from pydantic_ai.models.anthropic import AnthropicModel
-from pydantic_ai.models.fallback import FallbackModel
-from pydantic_ai.models.openai import OpenAIModel
-from pydantic_ai.models.gemini import GeminiModel
 from pydantic import BaseModel
+from llm_invoker.providers import get_fallback_model, get_gemini_model, get_openai_model
 
 
 class BaseNode(ABC):
 
     def __init__(self):
-        load_dotenv()
-        self.openai_model = OpenAIModel(model_name="gpt-4o")
-        self.gemini_model = GeminiModel(model_name="gemini-2.0-flash")
+        # Shared by all nodes, with one pooled HTTP client per provider
+        self.openai_model = get_openai_model()
+        self.gemini_model = get_gemini_model()
         # self.anthropic_model = AnthropicModel(model_name="claude-3-5-sonnet-latest")
-        self.fallback_model = FallbackModel(self.openai_model, self.gemini_model)
+        self.fallback_model = get_fallback_model()
 
     @abstractmethod
     async def extract(self, ocr_text: str) -> BaseModel:
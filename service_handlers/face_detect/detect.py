@@ -3,6 +3,9 @@ from models import ResponseStatusEnum, StandardResponse
 import cv2
 import numpy as np
 import math
+from functools import lru_cache
+from typing import Union
+from service_runtime import InputFile, as_input_file
 
 
 # Load the pre-trained DNN face detection model
@@ -10,23 +13,45 @@ prototxt_path = "service_handlers/face_detect/assets/deploy.prototxt"
 caffemodel_path = (
     "service_handlers/face_detect/assets/res10_300x300_ssd_iter_140000_fp16.caffemodel"
 )
-net = cv2.dnn.readNetFromCaffe(prototxt_path, caffemodel_path)
 
 
-def detect_face(image_path: str, required_face_coverage: float) -> StandardResponse:
+@lru_cache(maxsize=None)
+def get_face_net():
+    """Loads the face detection network once per process, on first use."""
+    return cv2.dnn.readNetFromCaffe(prototxt_path, caffemodel_path)
+
+
+def warm_up():
+    """Runs one forward pass on a blank frame, so the first request skips the graph setup."""
+    blob = cv2.dnn.blobFromImage(
+        np.zeros((300, 300, 3), dtype=np.uint8),
+        scalefactor=1.0,
+        size=(300, 300),
+        mean=(104.0, 177.0, 123.0),
+    )
+    net = get_face_net()
+    net.setInput(blob)
+    net.forward()
+
+
+def detect_face(
+    image_path: Union[str, InputFile], required_face_coverage: float
+) -> StandardResponse:
     """
     Detects faces in an image using a DNN-based model, and passes only if there is a single face
     covering at least the required area AND the face is centered in the image.
 
     Args:
-        image_path (str): Path of the image used for detecting face.
+        image_path (str | InputFile): Path of the image, or the uploaded image held in memory.
         required_face_coverage (float): Minimum percentage of the image area that the face bounding box must cover (e.g., 25 for 25%).
 
     Returns:
         StandardResponse: A response object containing the status, message, and result.
     """
-    # 1. Load the image
-    image = cv2.imread(image_path)
+    # 1. Load the image (copy, the decoded array is cached and we draw on it below)
+    image = as_input_file(image_path).to_ndarray()
+    if image is not None:
+        image = image.copy()
     if image is None:
         message = "Invalid image file"
         return StandardResponse(
@@ -41,6 +66,7 @@ def detect_face(image_path: str, required_face_coverage: float) -> StandardRespo
     blob = cv2.dnn.blobFromImage(
         image, scalefactor=1.0, size=(300, 300), mean=(104.0, 177.0, 123.0)
     )
+    net = get_face_net()
     net.setInput(blob)
     detections = net.forward()
 
@@ -1,20 +1,26 @@
 import os
 import re
-import wave
-from typing import List, Tuple
+from typing import List, Tuple, Union
 from geopy.geocoders import Nominatim
 import av
+import numpy as np
 import whisper
 import logging
 import difflib
+from functools import lru_cache
 from models import ResponseStatusEnum, StandardResponse
+from service_runtime import InputFile, as_input_file
+from service_runtime.metrics import observe_stage
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 
 def process_liveness(
-    video_path: str, lat: float, lng: float, captcha_list: List[str]
+    video_path: Union[str, InputFile],
+    lat: float,
+    lng: float,
+    captcha_list: List[str],
 ) -> StandardResponse:
     """
     Main entry function for liveness check. Verifies:
@@ -24,7 +30,9 @@ def process_liveness(
     """
     try:
         # Geolocation check
-        if not is_location_in_country(lat, lng):
+        with observe_stage("liveness", "geolocation"):
+            in_country = is_location_in_country(lat, lng)
+        if not in_country:
             return StandardResponse(
                 status=ResponseStatusEnum.failure.value,
                 message="Geolocation check failed: location not in India.",
@@ -32,7 +40,7 @@ def process_liveness(
             )
 
         # File existence check
-        if not os.path.exists(video_path):
+        if isinstance(video_path, str) and not os.path.exists(video_path):
             return StandardResponse(
                 status=ResponseStatusEnum.failure.value,
                 message=f"Video file '{video_path}' not found.",
@@ -97,76 +105,89 @@ def is_location_in_country(
 
 
 def match_captcha_keywords(
-    captcha_list: List[str], video_path: str
+    captcha_list: List[str], video_path: Union[str, InputFile]
 ) -> Tuple[bool, List[str]]:
     keyword_list = [kw.lower().strip() for kw in captcha_list]
 
-    audio_path = None
-    try:
-        audio_path = extract_audio_from_video(video_path)
-        transcribed_text = speech_to_text(audio_path)
-        match_found = match_keywords(transcribed_text, keyword_list)
-        logger.debug(
-            f"Captcha match result: {match_found}, \ntranscription: {transcribed_text}, \nkeywords: {keyword_list}"
-        )
-        if match_found:
-            return match_found, transcribed_text
-        elif not transcribed_text:
-            transcribed_text = ["No audio/spoken text detected in the video. Check your microphone and try again."]
-            return match_found, transcribed_text
-        else:
-            transcribed_text = [
-                f"Failed Captcha matching. Transcription: '{transcribed_text}'. Captcha: '{keyword_list}'"
-            ]
-            return match_found, transcribed_text
-    finally:
-        if audio_path and os.path.exists(audio_path):
-            os.remove(audio_path)
-
-
-def extract_audio_from_video(video_path: str) -> str:
-    audio_output = "extracted_audio.wav"
+    with observe_stage("liveness", "audio_extraction"):
+        audio = extract_audio_from_video(video_path)
+    with observe_stage("liveness", "transcription"):
+        transcribed_text = speech_to_text(audio)
+    match_found = match_keywords(transcribed_text, keyword_list)
+    logger.debug(
+        f"Captcha match result: {match_found}, \ntranscription: {transcribed_text}, \nkeywords: {keyword_list}"
+    )
+    if match_found:
+        return match_found, transcribed_text
+    elif not transcribed_text:
+        transcribed_text = ["No audio/spoken text detected in the video. Check your microphone and try again."]
+        return match_found, transcribed_text
+    else:
+        transcribed_text = [
+            f"Failed Captcha matching. Transcription: '{transcribed_text}'. Captcha: '{keyword_list}'"
+        ]
+        return match_found, transcribed_text
+
+
+def extract_audio_from_video(video_path: Union[str, InputFile]) -> np.ndarray:
+    """
+    Decodes the audio track straight from the video bytes into a mono float32
+    waveform at Whisper's sample rate. Nothing is written to disk.
+    """
+    source = as_input_file(video_path)
     try:
-        container = av.open(video_path)
-        audio_stream = next((s for s in container.streams if s.type == "audio"), None)
-
-        if not audio_stream:
-            raise ValueError(f"No audio stream found in the video file '{video_path}'.")
+        with source.open() as stream, av.open(stream) as container:
+            audio_stream = next(
+                (s for s in container.streams if s.type == "audio"), None
+            )
 
-        resampler = av.audio.resampler.AudioResampler(
-            format="s16p", layout="mono", rate=44100
-        )
+            if not audio_stream:
+                raise ValueError(
+                    f"No audio stream found in the video file '{source.filename}'."
+                )
 
-        with wave.open(audio_output, "wb") as wav_file:
-            wav_file.setnchannels(1)
-            wav_file.setsampwidth(2)  # 16-bit
-            wav_file.setframerate(44100)
+            resampler = av.audio.resampler.AudioResampler(
+                format="flt", layout="mono", rate=whisper.audio.SAMPLE_RATE
+            )
 
+            chunks: List[np.ndarray] = []
             for frame in container.decode(audio_stream):
                 frame.pts = None
-                resampled_frames = resampler.resample(frame)
-                for resampled_frame in resampled_frames:
-                    wav_file.writeframes(resampled_frame.to_ndarray().tobytes())
+                for resampled_frame in resampler.resample(frame):
+                    chunks.append(resampled_frame.to_ndarray().reshape(-1))
+            # Flush samples still buffered in the resampler
+            for resampled_frame in resampler.resample(None):
+                chunks.append(resampled_frame.to_ndarray().reshape(-1))
+
+        audio = (
+            np.concatenate(chunks).astype(np.float32)
+            if chunks
+            else np.zeros(0, dtype=np.float32)
+        )
+        logger.debug(f"Extracted {audio.shape[0]} audio samples from '{source.filename}'.")
+        return audio
 
-        container.close()
+    except Exception as e:
+        raise Exception(f"Error during audio extraction: {e}")
 
-        if os.path.exists(audio_output):
-            file_size = os.path.getsize(audio_output)
-            logger.debug(
-                f"Audio file '{audio_output}' created, size: {file_size} bytes."
-            )
-        else:
-            raise RuntimeError("Failed to create audio file.")
 
-        return audio_output
+@lru_cache(maxsize=None)
+def get_whisper_model(model_name: str = "base"):
+    """Loads a Whisper model once per process."""
+    return whisper.load_model(model_name)
 
-    except Exception as e:
-        raise Exception(f"Error during audio extraction: {e}")
+
+def warm_up():
+    """Loads Whisper and transcribes a second of silence."""
+    speech_to_text(np.zeros(whisper.audio.SAMPLE_RATE, dtype=np.float32))
 
 
-def speech_to_text(audio_path: str, model_name="base") -> List[str]:
+def speech_to_text(
+    audio_path: Union[str, np.ndarray], model_name="base"
+) -> List[str]:
+    """Transcribes an audio file, or a 16 kHz mono float32 waveform."""
     try:
-        model = whisper.load_model(model_name)
+        model = get_whisper_model(model_name)
         result = model.transcribe(audio=audio_path, language="en")
         text = str(result["text"]).lower()
         text = re.sub(r"[^\w\s]", "", text)
@@ -2,6 +2,7 @@ import cv2
 import pytesseract
 import base64
 from typing_extensions import Literal
+from service_runtime import InputFile
 from .maskers.masker_tesseract import mask_aadhaar_tesseract
 from .maskers.masker_llm import mask_aadhaar_with_llm
 from .maskers.masker_paddle import mask_aadhaar_paddle
@@ -9,7 +10,7 @@ from .maskers.masker_paddle import mask_aadhaar_paddle
 CREDENTIAL_TYPES = Literal["aadhaar"]
 
 async def mask_credential(
-    image_path: str,
+    image_path: str | InputFile,
     mask_value: str | None = None,
     credential_type: CREDENTIAL_TYPES = "aadhaar",
 ) -> str:
@@ -2,6 +2,7 @@ from pydantic_ai import Agent, BinaryContent
 from llm_invoker import LLMInvokerBaseNode
 from pathlib import Path
 import mimetypes
+from functools import lru_cache
 from typing import List, Tuple
 from pydantic import BaseModel, Field
 
@@ -98,3 +99,8 @@ class MaskAadhaarNode(LLMInvokerBaseNode):
         )
         print(f"LLM Result is: {result.output}")
         return result.output
+
+
+@lru_cache(maxsize=None)
+def get_mask_aadhaar_node() -> MaskAadhaarNode:
+    return MaskAadhaarNode()
@@ -2,7 +2,7 @@ import cv2
 import pytesseract
 import base64
 from typing_extensions import Literal
-from .aadhaar_node import MaskAadhaarNode
+from .aadhaar_node import get_mask_aadhaar_node
 from PIL import Image, ImageDraw, ImageOps, ExifTags
 import io
 from tempfile import NamedTemporaryFile
@@ -39,7 +39,7 @@ async def mask_aadhaar_with_llm(image_path: str, mask_value: str) -> str:
     try:
         with NamedTemporaryFile(suffix=".jpg", delete=False) as tmp:
             thumb.save(tmp.name, quality=88)
-            aadhaar_node = MaskAadhaarNode()
+            aadhaar_node = get_mask_aadhaar_node()
             boxes = await aadhaar_node.extract(tmp.name, mask_value)
             # boxes = await MaskAadhaarNode().extract(tmp.name, mask_value)
     except Exception as e:
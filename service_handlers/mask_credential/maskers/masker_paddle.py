@@ -2,16 +2,22 @@ import pytesseract
 from pytesseract import Output
 from PIL import Image, ImageDraw, ImageOps
 import numpy as np
-import cv2
 import base64
 import io
 import pathlib
 import re
-import logging
-from typing import List, NamedTuple
-from paddleocr import PaddleOCR
-from paddleocr.ppocr.utils.logging import get_logger
+from functools import lru_cache
+from typing import List, NamedTuple, Union
 import piexif
+from service_handlers.ocr_engine import (
+    OCREngine,
+    OCRLine,
+    OCRWorkerClient,
+    get_ocr_engine,
+    preprocess,
+)
+from service_runtime import run_cpu_bound, InputFile, as_input_file
+from service_runtime.metrics import observe_stage
 
 # ---------- Named Tuples ----------
 class Box(NamedTuple):
@@ -37,15 +43,15 @@ def rotate_image(img: Image.Image, angle: int) -> Image.Image:
 
 # ---------- PaddleOCR TextExtractor ----------
 class TextExtractor:
-    def __init__(self, ocr_instance: PaddleOCR):
-        self.ocr = ocr_instance
+    def __init__(self, engine: Union[OCREngine, OCRWorkerClient]):
+        self.engine = engine
 
     def get_bounding_box_from_result(
-        self, ocr_result, match: List[re.Pattern]
+        self, lines: List[OCRLine], match: List[re.Pattern]
     ) -> List[PatternMatches]:
         results = []
-        if ocr_result and ocr_result[0]:
-            for line in ocr_result[0]:
+        if lines:
+            for line in lines:
                 box_coords, (text, score) = line
                 if score > 0.8:
                     for pattern in match:
@@ -96,25 +102,36 @@ class TextMasker:
         buffer.seek(0)
         return base64.b64encode(buffer.read()).decode("utf-8")
 
-# ---------- Global PaddleOCR Instance ----------
-logger = get_logger()
-logger.setLevel(logging.ERROR)
-PADDLE_OCR = PaddleOCR(use_angle_cls=True, lang="en")
-EXTRACTOR = TextExtractor(PADDLE_OCR)
+# ---------- Shared OCR Engine ----------
+@lru_cache(maxsize=None)
+def get_extractor() -> TextExtractor:
+    """Uses the process wide OCR engine, the same models as the OCR services."""
+    return TextExtractor(get_ocr_engine())
+
 
 # ---------- Main Async Masking Function ----------
-async def mask_aadhaar_paddle(image_path: str, mask_value: str) -> str:
+async def mask_aadhaar_paddle(
+    image_path: Union[str, InputFile], mask_value: str
+) -> str:
     """
     Detects orientation using Tesseract, corrects image, runs PaddleOCR,
     masks Aadhaar-like text, and returns base64-encoded masked image.
+    The work itself is CPU bound and runs on the CPU executor.
     """
+    return await run_cpu_bound(
+        _mask_aadhaar_paddle, image_path=image_path, mask_value=mask_value
+    )
+
+
+def _mask_aadhaar_paddle(image_path: Union[str, InputFile], mask_value: str) -> str:
     # Step 1: Load and correct orientation
-    path = pathlib.Path(image_path)
-    assert path.exists(), f"Image not found: {image_path}"
-    pil_img = Image.open(path)
+    if isinstance(image_path, str):
+        assert pathlib.Path(image_path).exists(), f"Image not found: {image_path}"
+    pil_img = as_input_file(image_path).to_pil()
 
-    angle = get_image_orientation(pil_img)
-    rotated_img = rotate_image(pil_img, angle)
+    with observe_stage("masker_paddle", "orientation"):
+        angle = get_image_orientation(pil_img)
+        rotated_img = rotate_image(pil_img, angle)
 
     # Step 2: Prepare patterns
     cleaned = mask_value.replace(" ", "")
@@ -126,13 +143,18 @@ async def mask_aadhaar_paddle(image_path: str, mask_value: str) -> str:
     # print(f"The compiled patterns are: {compiled_patterns}")
 
     # Step 3: OCR and get matches
-    np_img = np.array(rotated_img)
-    ocr_result = PADDLE_OCR.ocr(np_img, det=True, rec=True)
-    matches = EXTRACTOR.get_bounding_box_from_result(ocr_result, compiled_patterns)
+    with observe_stage("masker_paddle", "ocr"):
+        np_img = np.array(rotated_img)
+        # OCR a cropped / downscaled copy, the boxes are masked on the full image
+        ocr_img, transform = preprocess(np_img)
+        extractor = get_extractor()
+        lines = transform.lines_to_original(extractor.engine.ocr_lines(ocr_img))
+        matches = extractor.get_bounding_box_from_result(lines, compiled_patterns)
 
     # Step 4: Mask and return base64
-    masker = TextMasker(rotated_img)
-    for match in matches:
-        masker.mask(full_text=match.full_text, text_to_mask=match.match_text, box=match.box)
+    with observe_stage("masker_paddle", "encode"):
+        masker = TextMasker(rotated_img)
+        for match in matches:
+            masker.mask(full_text=match.full_text, text_to_mask=match.match_text, box=match.box)
 
-    return masker.to_base64()
+        return masker.to_base64()
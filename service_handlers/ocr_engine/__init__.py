@@ -0,0 +1,11 @@
+from .engine import (
+    OCREngine,
+    OCRLine,
+    build_paddle_ocr,
+    get_local_ocr_engine,
+    get_ocr_engine,
+    load_ocr_engine,
+    warm_up,
+)
+from .preprocess import Transform, find_document_region, preprocess, to_bgr
+from .worker import OCRWorkerClient, start_ocr_worker, stop_ocr_worker
@@ -0,0 +1,253 @@
+"""
+Batched PaddleOCR engine, the one OCR model of a process.
+
+Shared by the OCR services and Aadhaar masking. PaddleOCR predictors are not safe to
+call from several threads at once, so OCR calls are not run by the calling thread.
+They are queued to a pool of OCR_ENGINE_POOL_SIZE OCR threads, each owning its own
+predictor instance. A thread takes the images waiting in the queue, up to
+OCR_BATCH_SIZE, and runs text detection image by image. While other OCR calls of the
+process are in progress it first waits up to OCR_BATCH_MAX_WAIT_MS for more images, a
+lone call runs right away. Then it runs direction classification and
+recognition over the text crops of all of them at once. Recognition batches crops of
+similar aspect ratio, so pooling the crops of several images fills its batches. Each
+caller gets back its own lines, in the format of `PaddleOCR.ocr(img)[0]`.
+
+    OCR_ENGINE_POOL_SIZE     OCR threads, each with its own det/cls/rec models   (default: 1)
+    OCR_BATCH_SIZE           images per batch   (default: 8)
+    OCR_BATCH_MAX_WAIT_MS    (default: 10)
+    OCR_REC_BATCH_NUM        text crops per recognition forward pass   (default: 16)
+
+Only calls that reach the same engine can share a batch. With the CPU process pool or
+pre-forked server workers the engine therefore lives in one dedicated OCR worker
+process (see worker.py), and `get_ocr_engine` returns a client that sends the calls of
+every process to it. Otherwise, e.g. with CPU_EXECUTOR_MODE=thread, the one process
+OCRs on its own engine.
+"""
+
+import copy
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, List, Union
+
+import cv2
+import numpy as np
+from paddleocr import PaddleOCR
+from paddleocr.paddleocr import check_img, predict_system
+from paddleocr.ppocr.utils.logging import get_logger
+
+from .worker import OCRWorkerClient, worker_address
+
+OCR_ENGINE_POOL_SIZE = int(os.getenv("OCR_ENGINE_POOL_SIZE", 1))
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", 8))
+OCR_BATCH_MAX_WAIT_MS = float(os.getenv("OCR_BATCH_MAX_WAIT_MS", 10))
+OCR_REC_BATCH_NUM = int(os.getenv("OCR_REC_BATCH_NUM", 16))
+
+logger = get_logger()
+logger.setLevel(logging.ERROR)
+
+# [box, (text, score)] with box the 4 corner points, as PaddleOCR returns them
+OCRLine = List[Any]
+
+
+@dataclass
+class _Job:
+    image: Union[str, bytes, np.ndarray]
+    future: Future = field(default_factory=Future)
+
+
+class OCREngine:
+    def __init__(
+        self,
+        factory: Callable[[], PaddleOCR],
+        pool_size: int = OCR_ENGINE_POOL_SIZE,
+        batch_size: int = OCR_BATCH_SIZE,
+        max_wait_ms: float = OCR_BATCH_MAX_WAIT_MS,
+    ):
+        self.factory = factory
+        self.pool_size = max(1, pool_size)
+        self.predictors: List[PaddleOCR] = []
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._reset()
+        # The predictors are loaded in a pre-fork master, the threads only ever start
+        # in the process that OCRs. Resets the lock and queue copied by a fork.
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[_Job]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        # ocr_lines calls in progress, queued or being OCR'd
+        self._callers = 0
+
+    def load(self) -> "OCREngine":
+        """Builds the predictors, if not done yet. No inference, no threads."""
+        with self._lock:
+            self._load()
+        return self
+
+    def _load(self):
+        while len(self.predictors) < self.pool_size:
+            self.predictors.append(self.factory())
+
+    def warm_up(self, image: np.ndarray):
+        """
+        Runs every predictor once on `image`. Before the OCR threads have started the
+        predictors are run directly, then the threads are started.
+        """
+        with self._lock:
+            if not self._threads:
+                self._load()
+                for ocr in self.predictors:
+                    self._run_batch(ocr, [_Job(image)])
+        self.ocr_lines(image)
+
+    def start(self) -> "OCREngine":
+        """Loads the predictors and starts the OCR threads, if not done yet."""
+        if not self._threads:
+            with self._lock:
+                if not self._threads:
+                    self._load()
+                    threads = [
+                        threading.Thread(
+                            target=self._serve,
+                            args=(ocr,),
+                            name=f"ocr-engine-{i}",
+                            daemon=True,
+                        )
+                        for i, ocr in enumerate(self.predictors)
+                    ]
+                    for thread in threads:
+                        thread.start()
+                    self._threads = threads
+        return self
+
+    def ocr_lines(self, image: Union[str, bytes, np.ndarray]) -> List[OCRLine]:
+        """
+        Text lines of an image path, encoded image or BGR array, sorted top to bottom.
+        Blocks until its batch has run.
+        """
+        job = _Job(image)
+        self.start()
+        with self._lock:
+            self._callers += 1
+        try:
+            self._queue.put(job)
+            return job.future.result()
+        finally:
+            with self._lock:
+                self._callers -= 1
+
+    def _serve(self, ocr: PaddleOCR):
+        while True:
+            jobs = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(jobs) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    # Only waits for more images while other calls are in progress
+                    jobs.append(
+                        self._queue.get(timeout=remaining)
+                        if remaining > 0 and self._callers > len(jobs)
+                        else self._queue.get_nowait()
+                    )
+                except queue.Empty:
+                    break
+            try:
+                self._run_batch(ocr, jobs)
+            except Exception as e:
+                for job in jobs:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+
+    def _run_batch(self, ocr: PaddleOCR, jobs: List[_Job]):
+        crop = (
+            predict_system.get_rotate_crop_image
+            if ocr.args.det_box_type == "quad"
+            else predict_system.get_minarea_rect_crop
+        )
+
+        # Detection is per image, the crops of all images are pooled
+        crops: List[np.ndarray] = []
+        detected = []
+        for job in jobs:
+            try:
+                img, _, _ = check_img(job.image)
+                if not isinstance(img, np.ndarray):
+                    raise ValueError("Could not decode image for OCR")
+                dt_boxes, _ = ocr.text_detector(img)
+                boxes = (
+                    predict_system.sorted_boxes(dt_boxes)
+                    if dt_boxes is not None and len(dt_boxes)
+                    else []
+                )
+                start = len(crops)
+                crops.extend(crop(img, copy.deepcopy(box)) for box in boxes)
+                detected.append((job, boxes, start))
+            except Exception as e:
+                job.future.set_exception(e)
+
+        rec_res = []
+        if crops:
+            if ocr.use_angle_cls:
+                crops, _, _ = ocr.text_classifier(crops)
+            rec_res, _ = ocr.text_recognizer(crops)
+
+        for job, boxes, start in detected:
+            lines = []
+            for box, (text, score) in zip(boxes, rec_res[start : start + len(boxes)]):
+                if score >= ocr.drop_score:
+                    lines.append([box.tolist(), (text, score)])
+            job.future.set_result(lines)
+
+
+def build_paddle_ocr() -> PaddleOCR:
+    return PaddleOCR(use_angle_cls=True, lang="en", rec_batch_num=OCR_REC_BATCH_NUM)
+
+
+@lru_cache(maxsize=None)
+def get_local_ocr_engine() -> OCREngine:
+    """The engine of this process. Its predictors are loaded on first use or by `load`."""
+    return OCREngine(build_paddle_ocr)
+
+
+@lru_cache(maxsize=None)
+def _get_worker_client(address: str) -> OCRWorkerClient:
+    return OCRWorkerClient(address)
+
+
+def get_ocr_engine() -> Union[OCREngine, OCRWorkerClient]:
+    """Where this process OCRs: the OCR worker when one was started, else its own engine."""
+    address = worker_address()
+    if address is None:
+        return get_local_ocr_engine()
+    return _get_worker_client(address)
+
+
+def load_ocr_engine() -> Union[OCREngine, OCRWorkerClient]:
+    """
+    Registry loader. Only builds the predictors, safe in a pre-fork master, or waits
+    for the OCR worker to have loaded them.
+    """
+    return get_ocr_engine().load()
+
+
+def warm_up():
+    """Runs det/cls/rec once on every predictor and starts the OCR threads."""
+    get_ocr_engine().warm_up(_warm_up_image())
+
+
+def warm_up_engine(engine: OCREngine):
+    engine.warm_up(_warm_up_image())
+
+
+def _warm_up_image() -> np.ndarray:
+    img = np.full((64, 320, 3), 255, dtype=np.uint8)
+    cv2.putText(img, "WARM UP 1234", (8, 44), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 0), 2)
+    return img
@@ -0,0 +1,116 @@
+"""
+Image preprocessing ahead of OCR.
+
+Phone photos of ID cards are 12+ MP of mostly background. Before OCR an image is
+optionally cropped to the document (the largest card-like contour), downscaled so its
+longest side is at most OCR_MAX_SIDE and optionally turned to grayscale. EXIF
+orientation is applied when images are decoded (`to_bgr`, `InputFile.to_ndarray`).
+
+The crop and scale are returned as a `Transform`, which maps the boxes found on the
+preprocessed image back onto the original one, e.g. to mask them.
+
+    OCR_MAX_SIDE         longest side in px, 0 keeps the size   (default: 1600)
+    OCR_CROP_DOCUMENT    crop to the document region   (default: false)
+    OCR_CROP_MIN_AREA    smallest region cropped to, as a fraction of the image   (default: 0.2)
+    OCR_GRAYSCALE        OCR a grayscale copy   (default: false)
+"""
+
+import os
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", 1600))
+OCR_CROP_DOCUMENT = os.getenv("OCR_CROP_DOCUMENT", "false").lower() == "true"
+OCR_CROP_MIN_AREA = float(os.getenv("OCR_CROP_MIN_AREA", 0.2))
+OCR_GRAYSCALE = os.getenv("OCR_GRAYSCALE", "false").lower() == "true"
+
+# Contours are searched on a copy this small, the region is scaled back up
+_CONTOUR_SIDE = 512
+# Margin kept around the document region, as a fraction of its size
+_CROP_MARGIN = 0.02
+
+
+@dataclass(frozen=True)
+class Transform:
+    """Preprocessed image = original[y:, x:] scaled by `scale`."""
+
+    x: int = 0
+    y: int = 0
+    scale: float = 1.0
+
+    def to_original(self, box: Sequence[Sequence[float]]) -> List[List[float]]:
+        return [[px / self.scale + self.x, py / self.scale + self.y] for px, py in box]
+
+    def lines_to_original(self, lines: list) -> list:
+        """OCR lines, `[box, (text, score)]`, with their boxes on the original image."""
+        return [[self.to_original(box), result] for box, result in lines]
+
+
+def to_bgr(pil_img: Image.Image) -> np.ndarray:
+    """OpenCV BGR array of a PIL image, upright according to its EXIF orientation."""
+    rgb = ImageOps.exif_transpose(pil_img).convert("RGB")
+    return cv2.cvtColor(np.asarray(rgb), cv2.COLOR_RGB2BGR)
+
+
+def find_document_region(
+    image: np.ndarray, min_area: float = OCR_CROP_MIN_AREA
+) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Bounding rect `(x, y, w, h)` of the largest contour, with a small margin, when it
+    covers at least `min_area` of the image and is not the whole image. None otherwise.
+    """
+    height, width = image.shape[:2]
+    factor = min(1.0, _CONTOUR_SIDE / max(height, width))
+    small = cv2.resize(image, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+    edges = cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 50, 150)
+    edges = cv2.dilate(edges, np.ones((3, 3), np.uint8), iterations=2)
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+
+    x, y, w, h = cv2.boundingRect(max(contours, key=cv2.contourArea))
+    covered = (w * h) / (small.shape[0] * small.shape[1])
+    if covered < min_area or covered > 0.95:
+        return None
+
+    margin_x, margin_y = w * _CROP_MARGIN, h * _CROP_MARGIN
+    x0 = max(0, int((x - margin_x) / factor))
+    y0 = max(0, int((y - margin_y) / factor))
+    x1 = min(width, int((x + w + margin_x) / factor))
+    y1 = min(height, int((y + h + margin_y) / factor))
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def preprocess(
+    image: np.ndarray,
+    *,
+    max_side: int = OCR_MAX_SIDE,
+    crop: bool = OCR_CROP_DOCUMENT,
+    grayscale: bool = OCR_GRAYSCALE,
+) -> Tuple[np.ndarray, Transform]:
+    """
+    The image to OCR and the transform from the original. Grayscale images are kept
+    three channel, as PaddleOCR expects.
+    """
+    x = y = 0
+    if crop:
+        region = find_document_region(image)
+        if region is not None:
+            x, y, w, h = region
+            image = image[y : y + h, x : x + w]
+
+    scale = 1.0
+    longest = max(image.shape[:2])
+    if max_side and longest > max_side:
+        scale = max_side / longest
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    if grayscale and image.ndim == 3:
+        image = cv2.cvtColor(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), cv2.COLOR_GRAY2BGR)
+
+    return image, Transform(x, y, scale)
@@ -0,0 +1,215 @@
+"""
+Dedicated OCR worker process.
+
+With more than one process (the CPU process pool, or pre-forked server workers) every
+process would hold its own engine and OCR its own images, one at a time, so nothing
+would ever be batched. Instead the main process starts one OCR worker that owns the
+`OCREngine`, and every process sends its OCR calls to it over a Unix socket. The calls
+of concurrent requests, files and pages all queue on that one engine and are batched
+there. A worker that dies is restarted; the calls in progress fail.
+
+    OCR_WORKER   true | false   (default: true with CPU_EXECUTOR_MODE=process or
+                 SERVER_WORKERS > 1, false runs an engine in every process)
+    OCR_WORKER_CONNECT_TIMEOUT   seconds a call waits for the worker to be ready
+                                 (default: 600)
+
+The socket path is passed to the other processes in OCR_WORKER_ADDRESS, set by the
+process that started the worker.
+"""
+
+import atexit
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Client, Connection, Listener, wait
+from typing import List, Optional, Union
+
+import numpy as np
+
+from service_runtime.executor import ExecutorModeEnum, get_cpu_executor_mode
+from service_runtime.prefork import SERVER_WORKERS
+
+logger = logging.getLogger(__name__)
+
+OCR_WORKER_CONNECT_TIMEOUT = float(os.getenv("OCR_WORKER_CONNECT_TIMEOUT", 600))
+ADDRESS_VAR = "OCR_WORKER_ADDRESS"
+
+# A worker that dies sooner than this after its start is restarted after a pause
+_MIN_WORKER_UPTIME = 5.0
+
+_process: Optional[multiprocessing.Process] = None
+_owner_pid: Optional[int] = None
+_stopping = False
+_lock = threading.Lock()
+
+
+def ocr_worker_enabled() -> bool:
+    default = get_cpu_executor_mode() == ExecutorModeEnum.process or SERVER_WORKERS > 1
+    return os.getenv("OCR_WORKER", str(default)).lower() == "true"
+
+
+def worker_address() -> Optional[str]:
+    """The socket of the OCR worker, None when this process OCRs on its own engine."""
+    return os.environ.get(ADDRESS_VAR)
+
+
+class OCRWorkerClient:
+    """
+    Sends OCR calls to the OCR worker, with the interface of `OCREngine`. Each thread
+    has its own connection, the worker runs the calls of all connections together.
+    """
+
+    def __init__(self, address: str):
+        self.address = address
+        self._local = threading.local()
+        # A connection copied by a fork would be shared with the parent
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._local = threading.local()
+
+    def _connection(self) -> Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        deadline = time.monotonic() + OCR_WORKER_CONNECT_TIMEOUT
+        while True:
+            try:
+                conn = Client(
+                    self.address,
+                    family="AF_UNIX",
+                    authkey=multiprocessing.current_process().authkey,
+                )
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                # The worker binds its socket once its models are loaded
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"OCR worker at {self.address} is not ready")
+                time.sleep(0.2)
+        self._local.conn = conn
+        return conn
+
+    def load(self) -> "OCRWorkerClient":
+        """Waits for the OCR worker to have loaded its models."""
+        self._connection()
+        return self
+
+    def warm_up(self, image: np.ndarray):
+        self.ocr_lines(image)
+
+    def ocr_lines(self, image: Union[str, bytes, np.ndarray]) -> List[list]:
+        """Text lines of an image path, encoded image or BGR array, OCR'd by the worker."""
+        conn = self._connection()
+        try:
+            conn.send(image)
+            ok, result = conn.recv()
+        except (EOFError, OSError) as e:
+            self._local.conn = None
+            conn.close()
+            raise RuntimeError(f"Lost the connection to the OCR worker: {e}")
+        if not ok:
+            raise RuntimeError(result)
+        return result
+
+
+def start_ocr_worker():
+    """
+    Starts the OCR worker, once, in the main process before the CPU workers or server
+    workers are started. They inherit OCR_WORKER_ADDRESS. A no-op in those workers.
+    """
+    global _owner_pid
+    if worker_address() is not None or not ocr_worker_enabled():
+        return
+    with _lock:
+        if _process is not None:
+            return
+        _owner_pid = os.getpid()
+        address = os.path.join(tempfile.gettempdir(), f"lyik-ocr-{os.getpid()}.sock")
+        os.environ[ADDRESS_VAR] = address
+        _spawn(address)
+    threading.Thread(
+        target=_supervise, args=(address,), name="ocr-worker", daemon=True
+    ).start()
+    atexit.register(stop_ocr_worker)
+
+
+def _spawn(address: str):
+    global _process
+    _process = multiprocessing.get_context("spawn").Process(
+        target=_serve, args=(address,), name="ocr-worker", daemon=True
+    )
+    _process.start()
+    logger.info(f"Started OCR worker {_process.pid} on {address}")
+
+
+def _supervise(address: str):
+    while True:
+        started_at = time.monotonic()
+        process = _process
+        # The sentinel works whoever reaps the process, e.g. the pre-fork master
+        wait([process.sentinel])
+        with _lock:
+            if _stopping:
+                return
+        logger.error(f"OCR worker {process.pid} exited, restarting it")
+        if time.monotonic() - started_at < _MIN_WORKER_UPTIME:
+            time.sleep(_MIN_WORKER_UPTIME)
+        with _lock:
+            if _stopping:
+                return
+            _spawn(address)
+
+
+def stop_ocr_worker():
+    """Stops the OCR worker, if this process started it."""
+    global _stopping
+    with _lock:
+        if _process is None or os.getpid() != _owner_pid or _stopping:
+            return
+        _stopping = True
+    _process.terminate()
+    _process.join(timeout=5)
+    address = os.environ.get(ADDRESS_VAR)
+    if address and os.path.exists(address):
+        os.unlink(address)
+
+
+def _serve(address: str):
+    """The OCR worker: loads and warms the engine, then serves every connection."""
+    from .engine import get_local_ocr_engine, warm_up_engine
+
+    engine = get_local_ocr_engine()
+    warm_up_engine(engine)
+
+    if os.path.exists(address):
+        os.unlink(address)
+    listener = Listener(
+        address, family="AF_UNIX", authkey=multiprocessing.current_process().authkey
+    )
+    while True:
+        try:
+            conn = listener.accept()
+        except Exception as e:  # e.g. a client with a wrong authkey
+            logger.warning(f"OCR worker refused a connection: {e}")
+            continue
+        threading.Thread(target=_handle, args=(engine, conn), daemon=True).start()
+
+
+def _handle(engine, conn: Connection):
+    with conn:
+        while True:
+            try:
+                image = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                reply = (True, engine.ocr_lines(image))
+            except Exception as e:
+                reply = (False, f"OCR failed: {e}")
+            try:
+                conn.send(reply)
+            except OSError:
+                return
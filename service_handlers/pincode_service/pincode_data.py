@@ -1,6 +1,7 @@
 import pandas as pd
 import logging
-from typing import Dict
+import threading
+from typing import Dict, Optional
 import os
 
 # from models import ResponseStatusEnum, StandardResponse
@@ -13,14 +14,25 @@ csv_path = os.path.join(script_dir, "all_pin_codes_data.csv")
 # ToDO: Add the proper path of the CSV for PINCODE
 # csv_path = "all_pin_codes_data.csv"
 
-df = pd.read_csv(csv_path, low_memory=False)
+_df: Optional[pd.DataFrame] = None
+_df_lock = threading.Lock()
 
-df.set_index("pincode", inplace=True, drop=False)
+
+def get_pincode_dataframe() -> pd.DataFrame:
+    """Reads the pin code CSV on first use, indexed by pincode."""
+    global _df
+    if _df is None:
+        with _df_lock:
+            if _df is None:
+                df = pd.read_csv(csv_path, low_memory=False)
+                df.set_index("pincode", inplace=True, drop=False)
+                _df = df
+    return _df
 
 
 def get_pincode_details(pincode: int) -> Dict:
     try:
-        result = df.loc[
+        result = get_pincode_dataframe().loc[
             pincode,
             [
                 "circlename",
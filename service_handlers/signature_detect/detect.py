@@ -1,8 +1,9 @@
 from ._base_node import BaseNode
 from pydantic import BaseModel
 from pydantic_ai import Agent, BinaryContent
-from pathlib import Path
-import mimetypes
+from functools import lru_cache
+from typing import Union
+from service_runtime import InputFile, as_input_file
 
 class SignatureDetectionResponse(BaseModel):
     # This model is returned by the signature detection service
@@ -24,21 +25,23 @@ class SignatureNode(BaseNode):
             output_type=SignatureDetectionResponse,
         )
 
-    async def extract(self, image_file: str) -> SignatureDetectionResponse:
-        f = Path(image_file)
+    async def extract(
+        self, image_file: Union[str, InputFile]
+    ) -> SignatureDetectionResponse:
+        f = as_input_file(image_file)
         result = await self.agent.run(
-            [
-                BinaryContent(
-                    data=f.read_bytes(), media_type=mimetypes.guess_type(image_file)[0]
-                )
-            ]
+            [BinaryContent(data=f.read_bytes(), media_type=f.mime)]
         )
         return result.output
 
 
-sign_node = SignatureNode()
+@lru_cache(maxsize=None)
+def get_sign_node() -> SignatureNode:
+    return SignatureNode()
 
 
-async def detect_signature(image_file: str) -> SignatureDetectionResponse:
-    resp = await sign_node.extract(image_file=image_file)
+async def detect_signature(
+    image_file: Union[str, InputFile],
+) -> SignatureDetectionResponse:
+    resp = await get_sign_node().extract(image_file=image_file)
     return resp
\ No newline at end of file
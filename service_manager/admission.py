@@ -0,0 +1,146 @@
+"""
+Per service admission control.
+
+Every service gets a concurrency limit and a bounded wait queue. Requests beyond
+`max_concurrency` wait in the queue; once `max_queue` requests are already waiting
+new requests are rejected immediately with `ServiceOverloaded`, which the API turns
+into a 429 with a `Retry-After` header.
+
+Limits can be overridden per service with environment variables, e.g. for `known_ocr`:
+    ADMISSION_KNOWN_OCR_CONCURRENCY=2
+    ADMISSION_KNOWN_OCR_QUEUE=16
+"""
+
+import asyncio
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from service_runtime.metrics import register_queue_source
+
+# service name -> (max concurrency, max queue depth)
+DEFAULT_LIMITS: Dict[str, Tuple[int, int]] = {
+    "liveness": (2, 8),
+    "detect_face": (4, 32),
+    "ocr": (2, 16),
+    "known_ocr": (2, 16),
+    "pin_code_data_extraction": (64, 256),
+    "mask_credential": (2, 16),
+    "detect_signature": (8, 32),
+}
+
+
+class ServiceOverloaded(Exception):
+    def __init__(self, service_name: str, retry_after: int):
+        super().__init__(
+            f"Service '{service_name}' is busy. Retry after {retry_after} seconds."
+        )
+        self.service_name = service_name
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """Handed out to an admitted request, carries the time it spent queued."""
+
+    def __init__(self, queue_wait: float):
+        self.queue_wait = queue_wait
+
+    @property
+    def queue_wait_ms(self) -> float:
+        return round(self.queue_wait * 1000, 2)
+
+
+class AdmissionController:
+    def __init__(self, service_name: str, max_concurrency: int, max_queue: int):
+        self.service_name = service_name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._waiting = 0
+        self._active = 0
+        # Moving average of the service time, used to estimate Retry-After
+        self._avg_service_time = 1.0
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def retry_after(self) -> int:
+        """Rough number of seconds until a queue slot frees up."""
+        batches = (self._waiting + 1) / self.max_concurrency
+        return max(1, math.ceil(batches * self._avg_service_time))
+
+    @asynccontextmanager
+    async def admit(
+        self, enforce_queue_limit: bool = True
+    ) -> AsyncIterator[AdmissionTicket]:
+        """
+        Waits for a free slot. Background jobs pass enforce_queue_limit=False, they were
+        already admitted by the job queue and only need to share the concurrency limit.
+        """
+        if (
+            enforce_queue_limit
+            and self._semaphore.locked()
+            and self._waiting >= self.max_queue
+        ):
+            raise ServiceOverloaded(self.service_name, self.retry_after())
+
+        queued_at = time.monotonic()
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+
+        started_at = time.monotonic()
+        self._active += 1
+        try:
+            yield AdmissionTicket(queue_wait=started_at - queued_at)
+        finally:
+            self._active -= 1
+            self._semaphore.release()
+            elapsed = time.monotonic() - started_at
+            self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * elapsed
+
+
+def _limits_for(service_name: str) -> Tuple[int, int]:
+    concurrency, queue = DEFAULT_LIMITS.get(service_name, (4, 16))
+    prefix = f"ADMISSION_{service_name.upper()}"
+    return (
+        int(os.getenv(f"{prefix}_CONCURRENCY", concurrency)),
+        int(os.getenv(f"{prefix}_QUEUE", queue)),
+    )
+
+
+_CONTROLLERS: Dict[str, AdmissionController] = {}
+
+
+def get_admission_controller(service_name: str) -> Optional[AdmissionController]:
+    """Returns the controller for a known service, None for unknown services."""
+    service_name = getattr(service_name, "value", service_name)
+    if service_name not in DEFAULT_LIMITS:
+        return None
+    if service_name not in _CONTROLLERS:
+        concurrency, queue = _limits_for(service_name)
+        _CONTROLLERS[service_name] = AdmissionController(
+            service_name=service_name, max_concurrency=concurrency, max_queue=queue
+        )
+    return _CONTROLLERS[service_name]
+
+
+def get_admission_controllers() -> Dict[str, AdmissionController]:
+    """A copy of the controllers created so far, safe to iterate from a metrics scrape."""
+    return dict(_CONTROLLERS)
+
+
+register_queue_source(
+    lambda: {
+        name: (c.waiting, c.active) for name, c in get_admission_controllers().items()
+    }
+)
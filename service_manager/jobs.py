@@ -0,0 +1,377 @@
+"""
+Asynchronous job API.
+
+`POST /jobs` reads the uploads into `InputFile`s, queues a job and returns its id right away.
+A fixed number of job workers take jobs off the queue in submission order and run
+them through `ServiceManager.run_service`, sharing the per service concurrency limits
+with `/process`. Job state and results live in a pluggable `JobStore`:
+
+    JOB_STORE         memory | sqlite            (default: memory, sqlite with SERVER_WORKERS > 1)
+    JOB_STORE_PATH    sqlite database file       (default: DATA_DIR/jobs.sqlite3)
+    JOB_RESULT_TTL    seconds results are kept   (default: 3600)
+    JOB_QUEUE_SIZE    max queued jobs            (default: 100)
+    JOB_WORKERS       concurrent job workers     (default: 4)
+    JOB_HEARTBEAT_INTERVAL   seconds between the keep-alives of a process's jobs   (default: 10)
+
+The uploads of a queued job are only held by the process that accepted it. With the
+sqlite store every process keeps its queued and running jobs alive, and fails the jobs
+of processes that stopped doing so (a restart, a crashed worker), at startup and on
+every keep-alive, instead of leaving them `queued` or `running` forever.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+from cachetools import TTLCache
+from fastapi import UploadFile
+from pydantic_core import to_jsonable_python
+
+from models import Job, JobStatusEnum, ResponseStatusEnum, StandardResponse
+from service_runtime import run_io_bound, stage_listener, InputFile
+from service_runtime.metrics import register_queue_source
+from service_runtime.prefork import SERVER_WORKERS
+from service_runtime.storage import data_path, ensure_parent_dir
+from .admission import ServiceOverloaded
+from .service_manager import ServiceManager
+
+logger = logging.getLogger(__name__)
+
+# Forked workers each have their own memory, a job is polled from any of them
+JOB_STORE = os.getenv("JOB_STORE", "sqlite" if SERVER_WORKERS > 1 else "memory")
+if JOB_STORE == "memory" and SERVER_WORKERS > 1:
+    raise RuntimeError(
+        "JOB_STORE=memory cannot be used with SERVER_WORKERS > 1, "
+        "a job polled from another worker would not be found. Use JOB_STORE=sqlite."
+    )
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", data_path("jobs.sqlite3"))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", 3600))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", 100))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", 10))
+
+# Jobs whose process missed this many keep-alives are failed
+_MISSED_HEARTBEATS = 3
+_UNFINISHED = (JobStatusEnum.queued.value, JobStatusEnum.running.value)
+ABANDONED_JOB_ERROR = "The job was lost when the server restarted. Please submit it again."
+
+# --- Job stores ---------------------------------------------------------------
+
+
+class JobStore(ABC):
+    @abstractmethod
+    async def save(self, job: Job):
+        pass
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[Job]:
+        pass
+
+    async def keep_alive(self):
+        """Marks the unfinished jobs saved by this store as still owned."""
+
+    async def fail_abandoned(self, own: bool = False) -> int:
+        """
+        Fails the unfinished jobs whose process stopped keeping them alive, or with
+        `own` those of this store, e.g. on shutdown. Returns how many were failed.
+        """
+        return 0
+
+    async def close(self):
+        pass
+
+
+class InMemoryJobStore(JobStore):
+    """Per process store, jobs are dropped `ttl` seconds after their last update."""
+
+    def __init__(self, ttl: int = JOB_RESULT_TTL, maxsize: int = 10000):
+        self._jobs = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def save(self, job: Job):
+        self._jobs[job.job_id] = job.model_copy(deep=True)
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        return job.model_copy(deep=True) if job else None
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Stores jobs as JSON rows in a SQLite file, so results survive restarts and can be
+    polled from any worker process sharing the file.
+    """
+
+    def __init__(
+        self,
+        path: str = JOB_STORE_PATH,
+        ttl: int = JOB_RESULT_TTL,
+        abandoned_after: float = JOB_HEARTBEAT_INTERVAL * _MISSED_HEARTBEATS,
+    ):
+        self.ttl = ttl
+        self.abandoned_after = abandoned_after
+        # The process saving through this store, the owner of the jobs it saves
+        self.owner = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            ensure_parent_dir(path), check_same_thread=False, timeout=30
+        )
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "status TEXT NOT NULL, owner TEXT NOT NULL, heartbeat_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def _save(self, job_id: str, data: str, status: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs "
+                "(job_id, data, updated_at, status, owner, heartbeat_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, data, now, status, self.owner, now),
+            )
+            self._conn.execute(
+                "DELETE FROM jobs WHERE updated_at < ?", (now - self.ttl,)
+            )
+            self._conn.commit()
+
+    def _get(self, job_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM jobs WHERE job_id = ? AND updated_at >= ?",
+                (job_id, time.time() - self.ttl),
+            ).fetchone()
+        return row[0] if row else None
+
+    def _keep_alive(self):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status IN (?, ?)",
+                (time.time(), self.owner, *_UNFINISHED),
+            )
+            self._conn.commit()
+
+    def _fail_abandoned(self, own: bool) -> int:
+        now = time.time()
+        with self._lock:
+            if own:
+                rows = self._conn.execute(
+                    "SELECT job_id, data FROM jobs WHERE owner = ? AND status IN (?, ?)",
+                    (self.owner, *_UNFINISHED),
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT job_id, data FROM jobs "
+                    "WHERE status IN (?, ?) AND heartbeat_at < ?",
+                    (*_UNFINISHED, now - self.abandoned_after),
+                ).fetchall()
+            for job_id, data in rows:
+                job = Job.model_validate(json.loads(data))
+                job.status = JobStatusEnum.failed
+                job.stage = "finished"
+                job.finished_at = now
+                job.error = ABANDONED_JOB_ERROR
+                job.result = StandardResponse(
+                    status=ResponseStatusEnum.failure, message=job.error
+                )
+                self._conn.execute(
+                    "UPDATE jobs SET data = ?, status = ?, updated_at = ? WHERE job_id = ?",
+                    (_dump_job(job), job.status.value, now, job_id),
+                )
+            self._conn.commit()
+        return len(rows)
+
+    async def save(self, job: Job):
+        await run_io_bound(self._save, job.job_id, _dump_job(job), job.status.value)
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        data = await run_io_bound(self._get, job_id)
+        return Job.model_validate(json.loads(data)) if data else None
+
+    async def keep_alive(self):
+        await run_io_bound(self._keep_alive)
+
+    async def fail_abandoned(self, own: bool = False) -> int:
+        return await run_io_bound(self._fail_abandoned, own)
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _dump_job(job: Job) -> str:
+    # serialize_unknown: handler results are not always JSON friendly (e.g. exceptions)
+    return json.dumps(to_jsonable_python(job, serialize_unknown=True))
+
+
+def build_job_store() -> JobStore:
+    if JOB_STORE == "sqlite":
+        return SQLiteJobStore(path=JOB_STORE_PATH, ttl=JOB_RESULT_TTL)
+    return InMemoryJobStore(ttl=JOB_RESULT_TTL)
+
+
+# --- Job manager --------------------------------------------------------------
+
+
+class JobManager:
+    def __init__(
+        self,
+        store: JobStore,
+        workers: int = JOB_WORKERS,
+        queue_size: int = JOB_QUEUE_SIZE,
+    ):
+        self.store = store
+        self.workers = workers
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._payloads: Dict[str, Tuple[List[InputFile], dict]] = {}
+        # Jobs currently running in this process, they carry the live stage
+        self._running: Dict[str, Job] = {}
+        self._tasks: List[asyncio.Task] = []
+        # Queue slots taken by submits still storing their job
+        self._reserved = 0
+
+    async def start(self):
+        # Jobs of a previous run are never run, their uploads are gone
+        await self._fail_abandoned()
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(), name=f"job-worker-{i}"))
+        self._tasks.append(asyncio.create_task(self._keep_alive(), name="job-keep-alive"))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        await self.store.fail_abandoned(own=True)
+        await self.store.close()
+
+    async def _fail_abandoned(self):
+        failed = await self.store.fail_abandoned()
+        if failed:
+            logger.warning(f"Failed {failed} jobs abandoned by a stopped process")
+
+    async def _keep_alive(self):
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                await self.store.keep_alive()
+                await self._fail_abandoned()
+            except Exception as e:
+                logger.error(f"Job keep-alive failed: {e}")
+
+    async def submit(
+        self, service_name: str, files: List[UploadFile], additional_params: dict
+    ) -> Job:
+        """Queues a job. Raises ServiceOverloaded when the job queue is full."""
+        # The slot is reserved before the first await, concurrent submits cannot
+        # overfill the queue
+        maxsize = self._queue.maxsize
+        if maxsize > 0 and self._queue.qsize() + self._reserved >= maxsize:
+            raise ServiceOverloaded("jobs", retry_after=5)
+        self._reserved += 1
+
+        stored_files: List[InputFile] = []
+        try:
+            # Large uploads spill to disk and stay there until the job has run
+            for f in files:
+                stored_files.append(await InputFile.from_upload(f))
+            job = Job(
+                job_id=uuid.uuid4().hex,
+                service_name=getattr(service_name, "value", service_name),
+                stage="queued",
+                created_at=time.time(),
+            )
+            await self.store.save(job)
+        except BaseException:
+            for f in stored_files:
+                f.close()
+            raise
+        finally:
+            self._reserved -= 1
+
+        # Only plain form values, the uploads are closed once the request returns
+        params = {k: v for k, v in additional_params.items() if isinstance(v, str)}
+        self._payloads[job.job_id] = (stored_files, params)
+        self._queue.put_nowait(job)
+        logger.info(f"Queued job {job.job_id} for {job.service_name}")
+        return job
+
+    def queue_depth(self) -> Dict[str, Tuple[int, int]]:
+        return {"jobs": (self._queue.qsize(), len(self._running))}
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        if job_id in self._running:
+            return self._running[job_id].model_copy(deep=True)
+        return await self.store.get(job_id)
+
+    async def _worker(self):
+        while True:
+            job: Job = await self._queue.get()
+            try:
+                await self._run(job)
+            except Exception as e:
+                logger.exception(f"Job {job.job_id} crashed: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job):
+        files, additional_params = self._payloads.pop(job.job_id)
+
+        job.status = JobStatusEnum.running
+        job.stage = "started"
+        job.started_at = time.time()
+        self._running[job.job_id] = job
+        await self.store.save(job)
+
+        def on_stage(stage: str):
+            job.stage = stage
+
+        try:
+            with stage_listener(on_stage):
+                response = await ServiceManager.run_service(
+                    job.service_name,
+                    files,
+                    additional_params,
+                    enforce_queue_limit=False,
+                )
+            job.result = response
+            job.status = (
+                JobStatusEnum.succeeded
+                if response.status == ResponseStatusEnum.success
+                else JobStatusEnum.failed
+            )
+        except Exception as e:
+            logger.exception(f"Job {job.job_id} failed: {e}")
+            job.status = JobStatusEnum.failed
+            job.error = "Services has failed. Please contact lyik support."
+            job.result = StandardResponse(
+                status=ResponseStatusEnum.failure, message=job.error
+            )
+        finally:
+            job.stage = "finished"
+            job.finished_at = time.time()
+            await self.store.save(job)
+            self._running.pop(job.job_id, None)
+            for f in files:
+                f.close()
+
+
+_job_manager: Optional[JobManager] = None
+
+
+def get_job_manager() -> JobManager:
+    global _job_manager
+    if _job_manager is None:
+        _job_manager = JobManager(store=build_job_store())
+        register_queue_source(_job_manager.queue_depth)
+    return _job_manager
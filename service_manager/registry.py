@@ -0,0 +1,162 @@
+"""
+Service registry.
+
+Maps every service name to its handler, to the loaders of its models, to the
+warmers that run a synthetic inference through them and to the servers, processes
+shared by all the workers. Handler modules and models are only imported/loaded on
+first use (or at warm-up, see warmup.py), so a worker only pays for the services it
+actually serves:
+
+    ENABLED_SERVICES   comma separated allow-list, e.g. "pin_code_data_extraction,detect_face"
+                       (default: all services)
+"""
+
+import importlib
+import logging
+import os
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+ENABLED_SERVICES = [
+    s.strip() for s in os.getenv("ENABLED_SERVICES", "").split(",") if s.strip()
+]
+
+ServiceHandler = Callable[[list, dict], Awaitable]
+
+
+class ServiceEntry:
+    def __init__(
+        self,
+        name: str,
+        handler: ServiceHandler,
+        loaders: Sequence[str] = (),
+        warmers: Sequence[str] = (),
+        cpu_bound: bool = False,
+        cacheable: bool = False,
+        cache_params: Sequence[str] = (),
+        servers: Sequence[str] = (),
+    ):
+        self.name = name
+        self.handler = handler
+        # "package.module:function" strings, each returns a loaded (cached) model
+        self.loaders = list(loaders)
+        # "package.module:function" strings, each runs a synthetic inference
+        self.warmers = list(warmers)
+        # "package.module:function" strings, each starts a process shared by all the
+        # workers, e.g. the OCR worker. Run in the main process before the workers start
+        self.servers = list(servers)
+        # The models run on the CPU executor, i.e. in the CPU worker processes
+        self.cpu_bound = cpu_bound
+        # Responses may be served from the response cache (see response_cache.py),
+        # keyed by the uploads and the `cache_params` form fields
+        self.cacheable = cacheable
+        self.cache_params = list(cache_params)
+        self.loaded = False
+        self.warmed = False
+
+
+class ServiceRegistry:
+    def __init__(self, enabled: Optional[Sequence[str]] = None):
+        self._entries: Dict[str, ServiceEntry] = {}
+        self._enabled = set(enabled) if enabled else None
+        self._lock = threading.Lock()
+
+    def register(
+        self,
+        name: str,
+        handler: ServiceHandler,
+        loaders: Sequence[str] = (),
+        warmers: Sequence[str] = (),
+        cpu_bound: bool = False,
+        cacheable: bool = False,
+        cache_params: Sequence[str] = (),
+        servers: Sequence[str] = (),
+    ):
+        name = getattr(name, "value", name)
+        self._entries[name] = ServiceEntry(
+            name=name,
+            handler=handler,
+            loaders=loaders,
+            warmers=warmers,
+            cpu_bound=cpu_bound,
+            cacheable=cacheable,
+            cache_params=cache_params,
+            servers=servers,
+        )
+
+    def is_registered(self, name: str) -> bool:
+        return getattr(name, "value", name) in self._entries
+
+    def is_enabled(self, name: str) -> bool:
+        name = getattr(name, "value", name)
+        return name in self._entries and (
+            self._enabled is None or name in self._enabled
+        )
+
+    def is_cpu_bound(self, name: str) -> bool:
+        return self._entries[getattr(name, "value", name)].cpu_bound
+
+    def get_cache_params(self, name: str) -> Optional[List[str]]:
+        """The params that key the cached responses of an enabled service, None if not cacheable."""
+        if not self.is_enabled(name):
+            return None
+        entry = self._entries[getattr(name, "value", name)]
+        return entry.cache_params if entry.cacheable else None
+
+    def enabled_services(self) -> List[str]:
+        return [name for name in self._entries if self.is_enabled(name)]
+
+    def get_handler(self, name: str) -> Optional[ServiceHandler]:
+        """Returns the handler of an enabled service, None otherwise."""
+        if not self.is_enabled(name):
+            return None
+        return self._entries[getattr(name, "value", name)].handler
+
+    def get_loaders(self, name: str) -> List[Callable]:
+        """Resolves the loader strings of a service into callables (imports their modules)."""
+        return _resolve(self._entries[getattr(name, "value", name)].loaders)
+
+    def get_warmers(self, name: str) -> List[Callable]:
+        return _resolve(self._entries[getattr(name, "value", name)].warmers)
+
+    def start_servers(self, names: Sequence[str]):
+        """Starts the servers of the given services, each once even when shared."""
+        targets = []
+        for name in names:
+            for target in self._entries[getattr(name, "value", name)].servers:
+                if target not in targets:
+                    targets.append(target)
+        for server in _resolve(targets):
+            server()
+
+    def load(self, name: str):
+        """Loads the models of a service. Blocking, models are cached by their loaders."""
+        entry = self._entries[getattr(name, "value", name)]
+        with self._lock:
+            if entry.loaded:
+                return
+            for loader in self.get_loaders(entry.name):
+                loader()
+            entry.loaded = True
+        logger.info(f"Loaded models for service {entry.name}")
+
+    def warm_up(self, name: str):
+        """Runs the synthetic inferences of a service, once per process."""
+        entry = self._entries[getattr(name, "value", name)]
+        with self._lock:
+            if entry.warmed:
+                return
+            for warmer in self.get_warmers(entry.name):
+                warmer()
+            entry.warmed = True
+        logger.info(f"Warmed up service {entry.name}")
+
+
+def _resolve(targets: Sequence[str]) -> List[Callable]:
+    resolved = []
+    for target in targets:
+        module_name, _, attr = target.partition(":")
+        resolved.append(getattr(importlib.import_module(module_name), attr))
+    return resolved
@@ -0,0 +1,194 @@
+"""
+Content-addressed response cache.
+
+Resubmitting the same document (retries, re-onboarding, multi-step forms) returns the
+stored response instead of running OCR, Whisper or a paid LLM call again. The key is
+the SHA-256 of the service name, the service's relevant params (e.g. document_type),
+the SHA-256 of every uploaded file and the hashed license key, so a response is only
+served back to the tenant it was computed for. Only successful responses are stored. Cached
+services are marked `cacheable` in the service registry; sensitive ones (e.g.
+mask_credential, whose response is the card image, or the liveness check) are not.
+
+    RESPONSE_CACHE           off | memory | disk   (default: off)
+    RESPONSE_CACHE_TTL       seconds an entry is kept   (default: 3600)
+    RESPONSE_CACHE_SIZE      max entries, least recently used go first   (default: 1000)
+    RESPONSE_CACHE_PATH      sqlite file of the disk backend   (default: DATA_DIR/response_cache.sqlite3)
+    RESPONSE_CACHE_EXCLUDE   comma separated services never cached, on top of the registry
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import List, Optional, Sequence
+
+from cachetools import TTLCache
+from pydantic_core import to_jsonable_python
+
+from license_manager.store import hash_license_key
+from models import StandardResponse
+from service_runtime import run_io_bound, InputFile
+from service_runtime.storage import data_path, ensure_parent_dir
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "off")
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 3600))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 1000))
+RESPONSE_CACHE_PATH = os.getenv(
+    "RESPONSE_CACHE_PATH", data_path("response_cache.sqlite3")
+)
+RESPONSE_CACHE_EXCLUDE = {
+    s.strip() for s in os.getenv("RESPONSE_CACHE_EXCLUDE", "").split(",") if s.strip()
+}
+
+
+class ResponseCache(ABC):
+    @abstractmethod
+    async def get(self, key: str) -> Optional[StandardResponse]:
+        pass
+
+    @abstractmethod
+    async def set(self, key: str, response: StandardResponse):
+        pass
+
+
+class InMemoryResponseCache(ResponseCache):
+    """Per process LRU cache with a TTL."""
+
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE, ttl: int = RESPONSE_CACHE_TTL):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key: str) -> Optional[StandardResponse]:
+        response = self._entries.get(key)
+        return response.model_copy(deep=True) if response else None
+
+    async def set(self, key: str, response: StandardResponse):
+        self._entries[key] = response.model_copy(deep=True)
+
+
+class SQLiteResponseCache(ResponseCache):
+    """
+    Stores responses as JSON rows in a SQLite file, shared by all processes on the host
+    and kept across restarts. Results come back as plain JSON (dicts instead of models).
+    """
+
+    def __init__(
+        self,
+        path: str = RESPONSE_CACHE_PATH,
+        maxsize: int = RESPONSE_CACHE_SIZE,
+        ttl: int = RESPONSE_CACHE_TTL,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            ensure_parent_dir(path), check_same_thread=False, timeout=30
+        )
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, data TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)"
+            )
+            self._conn.commit()
+
+    def _get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM responses WHERE key = ? AND created_at >= ?",
+                (key, now - self.ttl),
+            ).fetchone()
+            if row:
+                self._conn.execute(
+                    "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+                )
+                self._conn.commit()
+        return row[0] if row else None
+
+    def _set(self, key: str, data: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, data, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, data, now, now),
+            )
+            self._conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (now - self.ttl,)
+            )
+            # LRU: keep the `maxsize` most recently used entries
+            self._conn.execute(
+                "DELETE FROM responses WHERE key NOT IN ("
+                "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT ?)",
+                (self.maxsize,),
+            )
+            self._conn.commit()
+
+    async def get(self, key: str) -> Optional[StandardResponse]:
+        data = await run_io_bound(self._get, key)
+        return StandardResponse.model_validate(json.loads(data)) if data else None
+
+    async def set(self, key: str, response: StandardResponse):
+        data = json.dumps(to_jsonable_python(response, serialize_unknown=True))
+        await run_io_bound(self._set, key, data)
+
+
+def build_response_cache() -> Optional[ResponseCache]:
+    if RESPONSE_CACHE == "memory":
+        return InMemoryResponseCache()
+    if RESPONSE_CACHE == "disk":
+        return SQLiteResponseCache()
+    return None
+
+
+def _hash_files(files: Sequence[InputFile]) -> List[str]:
+    return [hashlib.sha256(f.read_bytes()).hexdigest() for f in files]
+
+
+async def response_cache_key(
+    service_name: str,
+    files: Sequence[InputFile],
+    additional_params: dict,
+    params: Sequence[str],
+) -> str:
+    """
+    SHA-256 over the service, its relevant `params`, the content of the files and the
+    license key of the request.
+    """
+    file_hashes = await run_io_bound(_hash_files, files) if files else []
+    payload = {
+        "service": service_name,
+        "params": {p: str(additional_params.get(p, "")) for p in sorted(params)},
+        "files": file_hashes,
+        "tenant": hash_license_key(additional_params.get("license_key") or ""),
+    }
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+_response_cache: Optional[ResponseCache] = None
+_initialized = False
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """The configured cache, None when caching is off."""
+    global _response_cache, _initialized
+    if not _initialized:
+        _response_cache = build_response_cache()
+        _initialized = True
+    return _response_cache
+
+
+def is_excluded(service_name: str) -> bool:
+    return service_name in RESPONSE_CACHE_EXCLUDE
@@ -1,30 +1,24 @@
 from models import StandardResponse, ResponseStatusEnum
 from fastapi import HTTPException, UploadFile, Request, Response
 from fastapi.responses import JSONResponse
-from tempfile import NamedTemporaryFile
-import shutil
-from typing import List, Union
+from typing import Dict, List, Sequence, Union
 from io import BytesIO
 # from service_handlers.signature_ml.utils.signature_extract import extract_signature
-from service_handlers.liveness import process_liveness
-from service_handlers.face_detect import detect_face
-from service_handlers.agent_ocr import (
-    process_document,
-    process_known_document,
-    OCRResponse,
-    DocumentProcessingState,
-    convert_pydantic_to_json,
-)
-from service_handlers.pincode_service import get_pincode_details
-from service_handlers.pincode_service.pin_code_models import PincodeDetails
-from service_handlers.mask_credential import mask_credential
-from service_handlers.signature_detect import detect_signature
+# NOTE: service_handlers are imported inside the handle_* methods, so a worker only
+# imports (and loads the models of) the services it actually serves. See registry.py
+from service_runtime import run_cpu_bound, run_io_bound, report_stage, InputFile
+from service_runtime.executor import ExecutorModeEnum, get_cpu_executor_mode
+from service_runtime.metrics import record_cache, record_request
+from .admission import get_admission_controller, ServiceOverloaded
+from .registry import ServiceRegistry, ENABLED_SERVICES
+from .response_cache import get_response_cache, is_excluded, response_cache_key
 from enum import Enum
-from pathlib import Path
+import asyncio
 import base64
+import json
 import logging
 from PIL import Image
-import os
+import time
 
 logger = logging.getLogger()
 
@@ -38,6 +32,31 @@ class ServicesEnum(str, Enum):
     PinCodeDataExtraction = "pin_code_data_extraction"
     MaskCredential = "mask_credential"
     SignatureDetection = "detect_signature"
+    # Runs several of the services above on the same uploads
+    Batch = "batch"
+
+
+# Services that decode the upload with OpenCV, batches pre-decode once for them
+IMAGE_DECODING_SERVICES = {
+    ServicesEnum.FaceDetection.value,
+    ServicesEnum.OCR.value,
+    ServicesEnum.KNOWN_OCR.value,
+}
+
+
+async def form_params(request: Request) -> dict:
+    """
+    The form fields passed on to the services. Starlette keeps the parsed form on the
+    request, so this reuses the form the endpoint's params were read from. Includes
+    the license key, also when it came in the X-License-Key header.
+    """
+    form = await request.form()
+    params = {k: v for k, v in form.items() if k != "service_name"}
+    # A key sent in the X-License-Key header, it scopes e.g. the cached responses
+    license_key = request.scope.get("state", {}).get("license_key")
+    if license_key and not params.get("license_key"):
+        params["license_key"] = license_key
+    return params
 
 
 class ServiceManager:
@@ -45,30 +64,217 @@ class ServiceManager:
     async def process_request(
         service_name: str, request: Request, files: List[UploadFile]
     ) -> StandardResponse:
-        form = await request.form()
-        additional_params = {k: v for k, v in form.items() if k != "service_name"}
-
-        if service_name == ServicesEnum.LivenessCheck.value:
-            return ServiceManager.handle_liveness_check(files, additional_params)
-        # elif service_name == ServicesEnum.SignatureExtraction.value:
-        #     return ServiceManager.handle_signature_extraction(files)
-        elif service_name == ServicesEnum.FaceDetection.value:
-            return ServiceManager.handle_face_detection(files)
-        elif service_name == ServicesEnum.OCR.value:
-            return await ServiceManager.handle_ocr(files)
-        elif service_name == ServicesEnum.KNOWN_OCR.value:
-            return await ServiceManager.handle_known_ocr(files, additional_params)
-        elif service_name == ServicesEnum.PinCodeDataExtraction.value:
-            return ServiceManager.handle_pincode_data_extraction(additional_params)
-        elif service_name == ServicesEnum.MaskCredential.value:
-            return await ServiceManager.handle_mask_credential(files, additional_params)
-        elif service_name == ServicesEnum.SignatureDetection.value:
-            return await ServiceManager.handle_signature_detection(files)
-        else:
+        return await ServiceManager.run_service(
+            service_name, files, await form_params(request)
+        )
+
+    @staticmethod
+    async def run_service(
+        service_name: str,
+        files: Sequence[Union[UploadFile, InputFile]],
+        additional_params: dict,
+        enforce_queue_limit: bool = True,
+    ) -> StandardResponse:
+        """Runs a service under its admission control. Shared by /process and the job workers."""
+        # Uploads are read once into memory here; the handlers never touch UploadFile
+        created = [
+            await InputFile.from_upload(f) for f in files if not isinstance(f, InputFile)
+        ]
+        created_iter = iter(created)
+        input_files = [
+            f if isinstance(f, InputFile) else next(created_iter) for f in files
+        ]
+        try:
+            if service_name == ServicesEnum.Batch.value:
+                return await _observed(
+                    service_name,
+                    ServiceManager.run_batch(
+                        input_files, additional_params, enforce_queue_limit
+                    ),
+                )
+            return await ServiceManager._run_admitted(
+                service_name, input_files, additional_params, enforce_queue_limit
+            )
+        finally:
+            for f in created:
+                f.close()
+
+    @staticmethod
+    async def run_batch(
+        files: List[InputFile], additional_params: dict, enforce_queue_limit: bool
+    ) -> StandardResponse:
+        """
+        Runs several services on the same uploads in one request.
+        Form fields:
+            services: JSON list or comma separated service names, e.g. "ocr,detect_face"
+            service_params: optional JSON object of per service params,
+                e.g. {"known_ocr": {"document_type": "aadhaar"}}
+        All other form fields are passed to every service. The services are independent
+        and run concurrently, each under its own admission control. The uploads are
+        read once. Images are also decoded once, except with the CPU process pool
+        (the default), where every service decodes the upload in its worker.
+        """
+        try:
+            service_names = _parse_batch_services(additional_params.get("services", ""))
+            service_params: Dict[str, dict] = json.loads(
+                additional_params.get("service_params") or "{}"
+            )
+            if not isinstance(service_params, dict):
+                raise ValueError("service_params must be a JSON object")
+            invalid = [k for k, v in service_params.items() if not isinstance(v, dict)]
+            if invalid:
+                raise ValueError(
+                    f"service_params of {', '.join(invalid)} must be JSON objects"
+                )
+        except (ValueError, TypeError) as e:
+            return StandardResponse(
+                status=ResponseStatusEnum.failure,
+                message=f"Invalid batch request: {e}",
+            )
+        if not service_names:
+            return StandardResponse(
+                status=ResponseStatusEnum.failure,
+                message="No services provided for batch",
+            )
+
+        # Decode the images once for the services running in this process. Not with the
+        # process pool: shipping the decoded array costs many times the upload, each
+        # worker decodes the upload itself.
+        if (
+            get_cpu_executor_mode() != ExecutorModeEnum.process
+            and len(IMAGE_DECODING_SERVICES.intersection(service_names)) > 1
+        ):
+            for f in files:
+                if (f.mime or "").startswith("image/"):
+                    await run_io_bound(f.to_ndarray)
+
+        common_params = {
+            k: v
+            for k, v in additional_params.items()
+            if k not in ("services", "service_params")
+        }
+
+        async def run_one(name: str) -> StandardResponse:
+            params = {**common_params, **service_params.get(name, {})}
+            try:
+                return await ServiceManager._run_admitted(
+                    name, files, params, enforce_queue_limit
+                )
+            except ServiceOverloaded as e:
+                response = StandardResponse(
+                    status=ResponseStatusEnum.failure, message=str(e)
+                )
+                response.add_metadata(retry_after=e.retry_after)
+                return response
+            except Exception as e:
+                logger.exception(e)
+                return StandardResponse(
+                    status=ResponseStatusEnum.failure,
+                    message="Services has failed. Please contact lyik support.",
+                )
+
+        responses = await asyncio.gather(*(run_one(name) for name in service_names))
+        succeeded = sum(
+            1 for r in responses if r.status == ResponseStatusEnum.success
+        )
+        return StandardResponse(
+            status=(
+                ResponseStatusEnum.success
+                if succeeded == len(responses)
+                else ResponseStatusEnum.failure
+            ),
+            message=f"{succeeded} of {len(responses)} services succeeded",
+            result=dict(zip(service_names, responses)),
+        )
+
+    @staticmethod
+    async def _run_admitted(
+        service_name: str,
+        files: List[InputFile],
+        additional_params: dict,
+        enforce_queue_limit: bool,
+    ) -> StandardResponse:
+        return await _observed(
+            service_name,
+            ServiceManager._cached_or_dispatch(
+                service_name, files, additional_params, enforce_queue_limit
+            ),
+        )
+
+    @staticmethod
+    async def _cached_or_dispatch(
+        service_name: str,
+        files: List[InputFile],
+        additional_params: dict,
+        enforce_queue_limit: bool,
+    ) -> StandardResponse:
+        """Serves a cacheable service from the response cache, skipping admission on a hit."""
+        cache = get_response_cache()
+        cache_params = SERVICE_REGISTRY.get_cache_params(service_name)
+        if cache is None or cache_params is None or is_excluded(service_name):
+            return await ServiceManager._admit_and_dispatch(
+                service_name, files, additional_params, enforce_queue_limit
+            )
+
+        key = await response_cache_key(
+            service_name, files, additional_params, cache_params
+        )
+        cached = await cache.get(key)
+        record_cache("response", hit=cached is not None)
+        if cached is not None:
+            cached.add_metadata(cache_hit=True)
+            return cached
+
+        response = await ServiceManager._admit_and_dispatch(
+            service_name, files, additional_params, enforce_queue_limit
+        )
+        if isinstance(response, StandardResponse):
+            if response.status == ResponseStatusEnum.success:
+                # Serving details (queue wait, ...) belong to this request only
+                await cache.set(key, response.model_copy(update={"metadata": None}))
+            response.add_metadata(cache_hit=False)
+        return response
+
+    @staticmethod
+    async def _admit_and_dispatch(
+        service_name: str,
+        files: List[InputFile],
+        additional_params: dict,
+        enforce_queue_limit: bool,
+    ) -> StandardResponse:
+        controller = get_admission_controller(service_name)
+        if controller is None:
+            return await ServiceManager.dispatch(
+                service_name, files, additional_params
+            )
+
+        # Raises ServiceOverloaded when the service queue is full
+        report_stage("waiting")
+        async with controller.admit(enforce_queue_limit=enforce_queue_limit) as ticket:
+            report_stage("running")
+            response = await ServiceManager.dispatch(
+                service_name, files, additional_params
+            )
+        if isinstance(response, StandardResponse):
+            response.add_metadata(queue_wait_ms=ticket.queue_wait_ms)
+        return response
+
+    @staticmethod
+    async def dispatch(
+        service_name: str, files: List[InputFile], additional_params: dict
+    ) -> StandardResponse:
+        handler = SERVICE_REGISTRY.get_handler(service_name)
+        if handler is None:
+            if SERVICE_REGISTRY.is_registered(service_name):
+                return StandardResponse(
+                    status=ResponseStatusEnum.failure.value,
+                    message=f"Service {service_name} is not enabled on this server",
+                )
             return StandardResponse(
                 status=ResponseStatusEnum.failure.value,
                 message=f"Unknown service: {service_name}",
             )
+        return await handler(files, additional_params)
 
     # @staticmethod
     # def handle_signature_extraction(files: List[UploadFile]):
@@ -117,31 +323,31 @@ class ServiceManager:
     #         )
 
     @staticmethod
-    def handle_face_detection(files: List[UploadFile]) -> StandardResponse:
+    async def handle_face_detection(
+        files: List[InputFile], additional_params: dict
+    ) -> StandardResponse:
+        from service_handlers.face_detect import detect_face
+
         logger.info("Initiating Liveness Check")
         if not files:
             return StandardResponse(
                 status=ResponseStatusEnum.failure.value,
                 message="No file provided for face detection",
             )
-        input_file = files[0]
-        suffix = Path(input_file.filename).suffix
-
-        with NamedTemporaryFile(delete=True, suffix=suffix) as temp_file:
-            shutil.copyfileobj(input_file.file, temp_file)
-            temp_file.flush()
-
-            result = detect_face(
-                image_path=temp_file.name,
-                required_face_coverage=0,  # this used to be 25%, now removing the required coverage check
-            )
+        result = await run_cpu_bound(
+            detect_face,
+            image_path=files[0],
+            required_face_coverage=0,  # this used to be 25%, now removing the required coverage check
+        )
 
-            return result
+        return result
 
     @staticmethod
-    def handle_liveness_check(
-        files: List[UploadFile], additional_params: dict
+    async def handle_liveness_check(
+        files: List[InputFile], additional_params: dict
     ) -> StandardResponse:
+        from service_handlers.liveness import process_liveness
+
         logger.info("Initiating Liveness Check")
         if not files:
             return StandardResponse(
@@ -157,43 +363,35 @@ class ServiceManager:
             if c.strip()
         ]
 
-        input_file = files[0]
-
-        with NamedTemporaryFile(delete=True, suffix=".mp4") as temp_file:
-            shutil.copyfileobj(input_file.file, temp_file)
-            temp_file.flush()
-
-            result = process_liveness(
-                video_path=temp_file.name, lat=lat, lng=lng, captcha_list=captcha_list
-            )
+        result = await run_cpu_bound(
+            process_liveness,
+            video_path=files[0],
+            lat=lat,
+            lng=lng,
+            captcha_list=captcha_list,
+        )
 
-            return result
+        return result
 
     @staticmethod
-    async def handle_ocr(files: List[UploadFile]) -> StandardResponse:
+    async def handle_ocr(
+        files: List[InputFile], additional_params: dict
+    ) -> StandardResponse:
+        from service_handlers.agent_ocr import (
+            process_document,
+            OCRResponse,
+            DocumentProcessingState,
+            convert_pydantic_to_json,
+        )
+
         logger.info("Initiating OCR")
         if not files:
             return StandardResponse(
                 status=ResponseStatusEnum.failure.value,
                 message="No file provided for ocr",
             )
-        image_paths = []
-        try:
-            for file in files:
-                contents = await file.read()
-                file_extension = os.path.splitext(file.filename)[1]
-                with NamedTemporaryFile(delete=False, suffix=file_extension) as tmp:
-                    tmp.write(contents)
-                    image_paths.append(tmp.name)
-
-            result = await process_document(image_path=image_paths)
-            result = DocumentProcessingState.model_validate(result)
-        finally:
-            for path in image_paths:
-                try:
-                    os.remove(path)
-                except OSError as e:
-                    print(f"Error deleting temporary file {path}: {e}")
+        result = await process_document(image_path=list(files))
+        result = DocumentProcessingState.model_validate(result)
 
         print(convert_pydantic_to_json(result))
         if not result.validated_data:
@@ -208,36 +406,29 @@ class ServiceManager:
             ),
         )
 
-    async def handle_known_ocr(files: List[UploadFile], additional_params: dict) -> StandardResponse:
+    @staticmethod
+    async def handle_known_ocr(files: List[InputFile], additional_params: dict) -> StandardResponse:
+        from service_handlers.agent_ocr import (
+            process_known_document,
+            OCRResponse,
+            DocumentProcessingState,
+            convert_pydantic_to_json,
+        )
+
         logger.info("Initiating OCR")
         if not files:
             return StandardResponse(
                 status=ResponseStatusEnum.failure.value,
                 message="No files provided for OCR.",
             )
-        image_paths = []
         ocr_document_type = additional_params.get("document_type", None)
         if not ocr_document_type:
             return StandardResponse(
                 status=ResponseStatusEnum.failure.value,
                 message="No document type provided",
             )
-        try:
-            for file in files:
-                contents = await file.read()
-                file_extension = os.path.splitext(file.filename)[1]
-                with NamedTemporaryFile(delete=False, suffix=file_extension) as tmp:
-                    tmp.write(contents)
-                    image_paths.append(tmp.name)
-
-            result = await process_known_document(image_path=image_paths, ocr_document_type=ocr_document_type)
-            result = DocumentProcessingState.model_validate(result)
-        finally:
-            for path in image_paths:
-                try:
-                    os.remove(path)
-                except OSError as e:
-                    print(f"Error deleting temporary file {path}: {e}")
+        result = await process_known_document(image_path=list(files), ocr_document_type=ocr_document_type)
+        result = DocumentProcessingState.model_validate(result)
 
         print(convert_pydantic_to_json(result))
         if not result.validated_data:
@@ -253,12 +444,17 @@ class ServiceManager:
         )
 
     @staticmethod
-    def handle_pincode_data_extraction(additional_params: dict) -> StandardResponse:
+    async def handle_pincode_data_extraction(
+        files: List[InputFile], additional_params: dict
+    ) -> StandardResponse:
+        from service_handlers.pincode_service import get_pincode_details
+        from service_handlers.pincode_service.pin_code_models import PincodeDetails
+
         logger.info("Initiating Pin Code Data Extraction")
         try:
             pincode = int(additional_params.get("pin_code", 0))
             pin_code_details: PincodeDetails = PincodeDetails.model_validate(
-                get_pincode_details(pincode)
+                await run_io_bound(get_pincode_details, pincode)
             )
             return StandardResponse(
                 status=ResponseStatusEnum.success,
@@ -274,7 +470,7 @@ class ServiceManager:
 
     @staticmethod
     async def handle_mask_credential(
-        files: List[UploadFile], additional_params: dict
+        files: List[InputFile], additional_params: dict
     ) -> StandardResponse:
         """
         Masks the given credential. provided the type. Currently only supports Aadhaar type.
@@ -284,6 +480,8 @@ class ServiceManager:
             "file_base64": Base64 of file content,
         }]
         """
+        from service_handlers.mask_credential import mask_credential
+
         logger.info("Initiating Credential Masking")
         if not files:
             return StandardResponse(
@@ -293,18 +491,13 @@ class ServiceManager:
         files_response = list()
         for file in files:
             input_file = file
-            suffix = Path(input_file.filename).suffix
 
             mask_value = additional_params.get("mask_value", None)
 
-            # Save the uploaded file temporarily in memory
-            with NamedTemporaryFile(delete=True, suffix=suffix) as tmp:
-                shutil.copyfileobj(input_file.file, tmp)
-                tmp.flush()
-                # Process the image and get base64 encoded result
-                encoded_file = await mask_credential(
-                    image_path=tmp.name, mask_value=mask_value
-                )
+            # Process the in-memory image and get base64 encoded result
+            encoded_file = await mask_credential(
+                image_path=input_file, mask_value=mask_value
+            )
             encoded_file_response = {
                 "file_name": f"masked_{input_file.filename}",
                 "file_base64": encoded_file,
@@ -316,7 +509,12 @@ class ServiceManager:
             result=files_response,
         )
 
-    async def handle_signature_detection(files: List[UploadFile]) -> StandardResponse:
+    @staticmethod
+    async def handle_signature_detection(
+        files: List[InputFile], additional_params: dict
+    ) -> StandardResponse:
+        from service_handlers.signature_detect import detect_signature
+
         if not files or len(files) == 0:
             return StandardResponse(
                 status=ResponseStatusEnum.failure,
@@ -324,17 +522,113 @@ class ServiceManager:
                 result=None,
             )
 
-        f = files[0]
-        suffix = Path(f.filename).suffix
-        with NamedTemporaryFile(delete=True, suffix=suffix) as tmp:
-            shutil.copyfileobj(f.file, tmp)
-            tmp.flush()
-            resp = await detect_signature(image_file=tmp.name)
-            return StandardResponse(
-                status=ResponseStatusEnum.success,
-                message="See the result payload",
-                result=resp,
-            )
+        resp = await detect_signature(image_file=files[0])
+        return StandardResponse(
+            status=ResponseStatusEnum.success,
+            message="See the result payload",
+            result=resp,
+        )
+
+
+SERVICE_REGISTRY = ServiceRegistry(enabled=ENABLED_SERVICES)
+SERVICE_REGISTRY.register(
+    ServicesEnum.LivenessCheck,
+    ServiceManager.handle_liveness_check,
+    loaders=["service_handlers.liveness.liveness:get_whisper_model"],
+    warmers=["service_handlers.liveness.liveness:warm_up"],
+    cpu_bound=True,
+    # Not cached: an anti-spoofing check must run on every submission
+    cacheable=False,
+)
+SERVICE_REGISTRY.register(
+    ServicesEnum.FaceDetection,
+    ServiceManager.handle_face_detection,
+    loaders=["service_handlers.face_detect.detect:get_face_net"],
+    warmers=["service_handlers.face_detect.detect:warm_up"],
+    cpu_bound=True,
+    cacheable=True,
+)
+SERVICE_REGISTRY.register(
+    ServicesEnum.OCR,
+    ServiceManager.handle_ocr,
+    loaders=["service_handlers.ocr_engine:load_ocr_engine"],
+    warmers=["service_handlers.ocr_engine:warm_up"],
+    servers=["service_handlers.ocr_engine:start_ocr_worker"],
+    cpu_bound=True,
+    cacheable=True,
+)
+SERVICE_REGISTRY.register(
+    ServicesEnum.KNOWN_OCR,
+    ServiceManager.handle_known_ocr,
+    loaders=["service_handlers.ocr_engine:load_ocr_engine"],
+    warmers=["service_handlers.ocr_engine:warm_up"],
+    servers=["service_handlers.ocr_engine:start_ocr_worker"],
+    cpu_bound=True,
+    cacheable=True,
+    cache_params=["document_type"],
+)
+SERVICE_REGISTRY.register(
+    ServicesEnum.PinCodeDataExtraction,
+    ServiceManager.handle_pincode_data_extraction,
+    loaders=["service_handlers.pincode_service.pincode_data:get_pincode_dataframe"],
+)
+SERVICE_REGISTRY.register(
+    ServicesEnum.MaskCredential,
+    ServiceManager.handle_mask_credential,
+    loaders=["service_handlers.ocr_engine:load_ocr_engine"],
+    warmers=["service_handlers.ocr_engine:warm_up"],
+    servers=["service_handlers.ocr_engine:start_ocr_worker"],
+    cpu_bound=True,
+    # Not cached: the response is the (masked) identity document itself
+    cacheable=False,
+)
+SERVICE_REGISTRY.register(
+    ServicesEnum.SignatureDetection,
+    ServiceManager.handle_signature_detection,
+    loaders=["service_handlers.signature_detect.detect:get_sign_node"],
+    cacheable=True,
+)
+
+
+async def _observed(service_name: str, call) -> StandardResponse:
+    """Awaits a service call and records its count, errors and latency."""
+    service_name = getattr(service_name, "value", service_name)
+    if service_name != ServicesEnum.Batch.value and not SERVICE_REGISTRY.is_registered(
+        service_name
+    ):
+        # Keep arbitrary names out of the metric labels
+        service_name = "unknown"
+    started = time.perf_counter()
+    try:
+        response = await call
+    except ServiceOverloaded:
+        record_request(service_name, time.perf_counter() - started, "overloaded")
+        raise
+    except Exception:
+        record_request(service_name, time.perf_counter() - started, "exception")
+        raise
+    succeeded = (
+        not isinstance(response, StandardResponse)
+        or response.status == ResponseStatusEnum.success
+    )
+    record_request(
+        service_name, time.perf_counter() - started, None if succeeded else "failure"
+    )
+    return response
+
+
+def _parse_batch_services(value: str) -> List[str]:
+    """Parses the batch `services` field, validates the names and drops duplicates."""
+    value = (value or "").strip()
+    names = json.loads(value) if value.startswith("[") else value.split(",")
+    services: List[str] = []
+    for name in (str(n).strip() for n in names):
+        if not name or name in services:
+            continue
+        if name == ServicesEnum.Batch.value:
+            raise ValueError("batch cannot be nested")
+        services.append(ServicesEnum(name).value)
+    return services
 
 
 def _save_image(base64_string: str, file_path: str):
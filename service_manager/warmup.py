@@ -0,0 +1,171 @@
+"""
+Model warm-up and readiness.
+
+At startup every enabled service loads its models and runs one synthetic inference
+(PaddleOCR det/cls/rec, the face SSD, Whisper), in the process its models actually run
+in: CPU bound services are warmed in every CPU worker process, and in every worker the
+pool starts later on. `/readyz` only reports ready once the warm-up has finished, so
+the orchestrator keeps traffic away from cold workers. `/healthz` is always up.
+
+    WARMUP_ON_STARTUP   true | false   (default: true, false reports ready immediately)
+    WARMUP_TIMEOUT      seconds        (default: 600)
+
+Processes shared by all the workers, e.g. the OCR worker, are started first, by the
+main process. In pre-fork mode (service_runtime/prefork.py) the master only loads the
+models, the inference warm-up runs in every forked worker:
+
+    PREFORK_PRELOAD_SERVICES   comma separated services loaded in the master
+                               (default: all enabled, e.g. leave out "liveness" to
+                               let each worker load Whisper on its own)
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Sequence
+
+from service_runtime import (
+    run_io_bound,
+    run_on_all_cpu_workers,
+    set_worker_initializer,
+)
+from service_runtime.executor import ExecutorModeEnum, get_cpu_executor_mode
+from .service_manager import SERVICE_REGISTRY
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", 600))
+PREFORK_PRELOAD_SERVICES = [
+    s.strip() for s in os.getenv("PREFORK_PRELOAD_SERVICES", "").split(",") if s.strip()
+]
+
+
+class WarmupState:
+    def __init__(self):
+        self.status = "pending"  # pending | running | ready | failed
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # service name -> {"ok": bool, "ms": float, "error": str}
+        self.services: Dict[str, dict] = {}
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    def to_dict(self) -> dict:
+        return {
+            "status": self.status,
+            "ready": self.ready,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "services": self.services,
+        }
+
+
+_state = WarmupState()
+
+
+def get_warmup_state() -> WarmupState:
+    return _state
+
+
+def warm_up_services(
+    names: Sequence[str], load: bool = True, warm: bool = True
+) -> Dict[str, dict]:
+    """
+    Blocking. Loads the models of the given services and/or runs their warmers in the
+    calling process and never raises. Also used as the CPU worker process initializer.
+    """
+    results = {}
+    for name in names:
+        started = time.perf_counter()
+        try:
+            if load:
+                SERVICE_REGISTRY.load(name)
+            if warm:
+                SERVICE_REGISTRY.warm_up(name)
+            results[name] = {"ok": True}
+        except Exception as e:
+            logger.exception(f"Warm-up of {name} failed: {e}")
+            results[name] = {"ok": False, "error": str(e)}
+        results[name]["ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return results
+
+
+def start_servers():
+    """
+    Starts the processes shared by the workers of the enabled services. In the main
+    process, before any worker is started, a no-op in the workers.
+    """
+    SERVICE_REGISTRY.start_servers(SERVICE_REGISTRY.enabled_services())
+
+
+def preload_models():
+    """Pre-fork master: loads the models without running any inference (see above)."""
+    start_servers()
+    names = [
+        name
+        for name in PREFORK_PRELOAD_SERVICES or SERVICE_REGISTRY.enabled_services()
+        if SERVICE_REGISTRY.is_enabled(name)
+    ]
+    results = warm_up_services(names, load=True, warm=False)
+    logger.info(f"Preloaded models: {results}")
+
+
+def _merge(results: Dict[str, dict], new: Dict[str, dict]):
+    for name, result in new.items():
+        previous = results.get(name)
+        if previous is None:
+            results[name] = dict(result)
+            continue
+        # Several processes warm the same service: report the slowest, keep failures
+        previous["ms"] = max(previous["ms"], result["ms"])
+        if not result["ok"]:
+            previous["ok"] = False
+            previous["error"] = result.get("error")
+
+
+async def run_warmup() -> WarmupState:
+    state = _state
+    if not WARMUP_ON_STARTUP:
+        state.status = "ready"
+        return state
+
+    state.status = "running"
+    state.started_at = time.time()
+    names = SERVICE_REGISTRY.enabled_services()
+    in_workers: List[str] = []
+    if get_cpu_executor_mode() == ExecutorModeEnum.process:
+        in_workers = [n for n in names if SERVICE_REGISTRY.is_cpu_bound(n)]
+
+    results: Dict[str, dict] = {}
+    try:
+        if in_workers:
+            # Workers started later (e.g. after a crash) warm up before taking work
+            set_worker_initializer(warm_up_services, in_workers)
+        in_process = [n for n in names if n not in in_workers]
+        if in_process:
+            _merge(results, await run_io_bound(warm_up_services, in_process))
+        if in_workers:
+            per_worker = await asyncio.wait_for(
+                run_on_all_cpu_workers(warm_up_services, in_workers),
+                timeout=WARMUP_TIMEOUT,
+            )
+            for worker_results in per_worker.values():
+                _merge(results, worker_results)
+        failed = [name for name, r in results.items() if not r["ok"]]
+        state.status = "failed" if failed else "ready"
+    except Exception as e:
+        logger.exception(f"Warm-up failed: {e}")
+        state.status = "failed"
+    finally:
+        state.services = results
+        state.finished_at = time.time()
+
+    logger.info(
+        f"Warm-up {state.status} in {state.finished_at - state.started_at:.1f}s: {results}"
+    )
+    return state
+
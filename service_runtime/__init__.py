@@ -0,0 +1,10 @@
+from .executor import (
+    run_cpu_bound,
+    run_io_bound,
+    run_on_all_cpu_workers,
+    set_worker_initializer,
+    shutdown_executors,
+)
+from .progress import report_stage, stage_listener
+from .single_flight import SingleFlight
+from .uploads import InputFile, as_input_file
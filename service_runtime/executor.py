@@ -0,0 +1,207 @@
+"""
+Executor layer that keeps blocking work off the asyncio event loop.
+
+CPU bound model inference (PaddleOCR, Whisper, the face SSD, tesseract) is sent to
+a bounded process pool, blocking I/O (temp files, CSV lookups, geocoding) goes to a
+thread pool. Handlers only ever ``await run_cpu_bound(...)`` / ``await run_io_bound(...)``
+so the pool flavour can be changed through configuration:
+
+    CPU_EXECUTOR_MODE      process | thread | inline   (default: process)
+    CPU_POOL_WORKERS       number of CPU workers       (default: half the cores)
+    IO_POOL_WORKERS        number of I/O threads        (default: 16)
+    PROCESS_START_METHOD   spawn | forkserver | fork   (default: spawn)
+"""
+
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from enum import Enum
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ExecutorModeEnum(str, Enum):
+    process = "process"
+    thread = "thread"
+    inline = "inline"  # run on the calling thread, only meant for debugging
+
+
+CPU_EXECUTOR_MODE = ExecutorModeEnum(os.getenv("CPU_EXECUTOR_MODE", "process"))
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+IO_POOL_WORKERS = int(os.getenv("IO_POOL_WORKERS", 16))
+PROCESS_START_METHOD = os.getenv("PROCESS_START_METHOD", "spawn")
+
+_cpu_executor: Optional[Executor] = None
+_io_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+# Runs in every CPU worker process as it starts, e.g. to load and warm models
+_worker_initializer: Optional[Callable] = None
+_worker_initargs: Tuple = ()
+
+
+def configure_cpu_executor(
+    mode: Optional[ExecutorModeEnum] = None, workers: Optional[int] = None
+):
+    """
+    Overrides CPU_EXECUTOR_MODE / CPU_POOL_WORKERS at runtime, e.g. in pre-forked
+    server workers. Only takes effect before the CPU executor is first used.
+    """
+    global CPU_EXECUTOR_MODE, CPU_POOL_WORKERS
+    with _lock:
+        if _cpu_executor is not None:
+            logger.warning("CPU executor already started, configuration not changed")
+            return
+        if mode is not None:
+            CPU_EXECUTOR_MODE = ExecutorModeEnum(mode)
+        if workers is not None:
+            CPU_POOL_WORKERS = max(1, workers)
+
+
+def get_cpu_executor_mode() -> ExecutorModeEnum:
+    return CPU_EXECUTOR_MODE
+
+
+def set_worker_initializer(initializer: Optional[Callable], *initargs: Any):
+    """
+    Sets a module level callable that every new CPU worker process runs before taking
+    work. Applies to pools created afterwards, including a pool recreated after a crash.
+    """
+    global _worker_initializer, _worker_initargs
+    with _lock:
+        _worker_initializer = initializer
+        _worker_initargs = initargs
+
+
+def get_cpu_executor() -> Optional[Executor]:
+    """Returns the shared CPU executor, creating it on first use. None in inline mode."""
+    global _cpu_executor
+    if CPU_EXECUTOR_MODE == ExecutorModeEnum.inline:
+        return None
+    with _lock:
+        if _cpu_executor is None:
+            if CPU_EXECUTOR_MODE == ExecutorModeEnum.process:
+                _cpu_executor = ProcessPoolExecutor(
+                    max_workers=CPU_POOL_WORKERS,
+                    mp_context=multiprocessing.get_context(PROCESS_START_METHOD),
+                    initializer=_worker_initializer,
+                    initargs=_worker_initargs,
+                )
+            else:
+                _cpu_executor = ThreadPoolExecutor(
+                    max_workers=CPU_POOL_WORKERS, thread_name_prefix="cpu-worker"
+                )
+            logger.info(
+                f"Started {CPU_EXECUTOR_MODE.value} CPU executor with {CPU_POOL_WORKERS} workers"
+            )
+        return _cpu_executor
+
+
+def get_io_executor() -> ThreadPoolExecutor:
+    """Returns the shared I/O thread pool, creating it on first use."""
+    global _io_executor
+    with _lock:
+        if _io_executor is None:
+            _io_executor = ThreadPoolExecutor(
+                max_workers=IO_POOL_WORKERS, thread_name_prefix="io-worker"
+            )
+        return _io_executor
+
+
+def _reset_cpu_executor(broken: Executor):
+    """Drops a broken process pool (e.g. a worker was OOM killed) so the next call gets a new one."""
+    global _cpu_executor
+    with _lock:
+        if _cpu_executor is broken:
+            _cpu_executor = None
+    pids = _worker_pids(broken)
+    broken.shutdown(wait=False, cancel_futures=True)
+    _mark_workers_dead(pids)
+
+
+def _worker_pids(executor: Executor) -> list:
+    return list(getattr(executor, "_processes", None) or {})
+
+
+def _mark_workers_dead(pids: list):
+    from .metrics import mark_process_dead
+
+    for pid in pids:
+        mark_process_dead(pid)
+
+
+async def run_cpu_bound(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Runs a CPU bound callable on the CPU executor and awaits its result.
+    In process mode `func` and its arguments must be picklable (module level functions).
+    """
+    executor = get_cpu_executor()
+    if executor is None:
+        return func(*args, **kwargs)
+
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(
+            executor, functools.partial(func, *args, **kwargs)
+        )
+    except BrokenProcessPool:
+        logger.error("CPU process pool is broken, it will be recreated on next use")
+        _reset_cpu_executor(executor)
+        raise
+
+
+async def run_io_bound(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Runs a blocking I/O callable on the I/O thread pool and awaits its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_io_executor(), functools.partial(func, *args, **kwargs)
+    )
+
+
+def _call_with_pid(func: Callable[..., T], *args: Any) -> Tuple[int, T]:
+    return os.getpid(), func(*args)
+
+
+async def run_on_all_cpu_workers(func: Callable[..., T], *args: Any) -> Dict[int, T]:
+    """
+    Runs `func(*args)` once in every CPU worker process and returns the results by pid.
+    Starts the workers if needed. `func` must be idempotent, a worker can get it twice.
+    Outside of process mode it runs once, in this process.
+    """
+    if CPU_EXECUTOR_MODE != ExecutorModeEnum.process:
+        pid, result = await run_cpu_bound(_call_with_pid, func, *args)
+        return {pid: result}
+
+    results: Dict[int, T] = {}
+    # Workers are spawned on demand, one per submission while none is idle. Keep
+    # submitting a round per worker until every worker has answered.
+    while len(results) < CPU_POOL_WORKERS:
+        answers = await asyncio.gather(
+            *(
+                run_cpu_bound(_call_with_pid, func, *args)
+                for _ in range(CPU_POOL_WORKERS)
+            )
+        )
+        results.update(answers)
+    return results
+
+
+def shutdown_executors(wait: bool = True):
+    """Shuts down both pools. Safe to call more than once."""
+    global _cpu_executor, _io_executor
+    with _lock:
+        cpu, io = _cpu_executor, _io_executor
+        _cpu_executor = _io_executor = None
+    if cpu is not None:
+        pids = _worker_pids(cpu)
+        cpu.shutdown(wait=wait, cancel_futures=True)
+        _mark_workers_dead(pids)
+    if io is not None:
+        io.shutdown(wait=wait, cancel_futures=True)
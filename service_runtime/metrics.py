@@ -0,0 +1,179 @@
+"""
+Prometheus metrics, served by `GET /metrics`.
+
+    lyik_requests_total{service}                     requests per service
+    lyik_request_errors_total{service, reason}       failure | overloaded | exception
+    lyik_request_duration_seconds{service}           end to end latency, incl. queueing
+    lyik_stage_duration_seconds{component, stage}    pipeline stages (OCR, LLM, ...)
+    lyik_queue_waiting{queue} / lyik_queue_active{queue}
+                                                     admission queues and the job queue
+    lyik_cache_requests_total{cache, result}         hit | miss, hit rate = hit / total
+    lyik_llm_request_duration_seconds{model, outcome}
+                                                     LLM provider latency per model
+
+CPU bound stages run in the CPU worker processes (and pre-fork mode runs several server
+processes), so metrics are collected in prometheus_client's multi-process mode whenever
+more than one process is involved. PROMETHEUS_MULTIPROC_DIR can point to the directory
+to use (default: `lyik-metrics` in the temp directory). The process that starts the
+workers empties it at startup (`clear_multiprocess_dir`), so it must not be shared by
+several servers. The files of a worker process that exited are marked dead by the
+process that started it.
+"""
+
+import glob
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+if "PROMETHEUS_MULTIPROC_DIR" not in os.environ and (
+    os.getenv("CPU_EXECUTOR_MODE", "process") == "process"
+    or int(os.getenv("SERVER_WORKERS", 1)) > 1
+):
+    # Must be set before the first metric is created. Spawned and forked workers inherit it.
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = os.path.join(
+        tempfile.gettempdir(), "lyik-metrics"
+    )
+
+if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily  # noqa: E402
+
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+_LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+REQUESTS = Counter("lyik_requests", "Requests per service", ["service"])
+REQUEST_ERRORS = Counter(
+    "lyik_request_errors", "Failed requests per service", ["service", "reason"]
+)
+REQUEST_LATENCY = Histogram(
+    "lyik_request_duration_seconds",
+    "Request latency per service",
+    ["service"],
+    buckets=_LATENCY_BUCKETS,
+)
+STAGE_LATENCY = Histogram(
+    "lyik_stage_duration_seconds",
+    "Latency of the pipeline stages of a component",
+    ["component", "stage"],
+    buckets=_LATENCY_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    "lyik_cache_requests", "Cache lookups by result", ["cache", "result"]
+)
+LLM_LATENCY = Histogram(
+    "lyik_llm_request_duration_seconds",
+    "LLM provider latency per model",
+    ["model", "outcome"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+
+def record_request(service: str, seconds: float, error: Optional[str] = None):
+    """`error` is None for a successful request, otherwise the failure reason."""
+    service = getattr(service, "value", service)
+    REQUESTS.labels(service).inc()
+    REQUEST_LATENCY.labels(service).observe(seconds)
+    if error:
+        REQUEST_ERRORS.labels(service, error).inc()
+
+
+@contextmanager
+def observe_stage(component: str, stage: str) -> Iterator[None]:
+    """Times a pipeline stage, also when it raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(component, stage).observe(time.perf_counter() - started)
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+@contextmanager
+def observe_llm(model: str) -> Iterator[None]:
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "success"
+    finally:
+        LLM_LATENCY.labels(model, outcome).observe(time.perf_counter() - started)
+
+
+# --- Queue depths -------------------------------------------------------------
+
+# Each source returns {queue name: (waiting, active)}, read at scrape time
+QueueSource = Callable[[], Dict[str, Tuple[int, int]]]
+_queue_sources: List[QueueSource] = []
+
+
+def register_queue_source(source: QueueSource):
+    _queue_sources.append(source)
+
+
+class _QueueCollector:
+    """Reports the queues of the serving process, read when scraped."""
+
+    def collect(self):
+        waiting = GaugeMetricFamily(
+            "lyik_queue_waiting", "Requests waiting in a queue", labels=["queue"]
+        )
+        active = GaugeMetricFamily(
+            "lyik_queue_active", "Requests being processed", labels=["queue"]
+        )
+        for source in _queue_sources:
+            for name, (n_waiting, n_active) in source().items():
+                waiting.add_metric([name], n_waiting)
+                active.add_metric([name], n_active)
+        yield waiting
+        yield active
+
+
+_queue_collector = _QueueCollector()
+if not MULTIPROCESS:
+    REGISTRY.register(_queue_collector)
+
+
+def clear_multiprocess_dir():
+    """
+    Drops the values a previous run left in PROMETHEUS_MULTIPROC_DIR. Called once by the
+    process that starts the workers, before it starts them.
+    """
+    if not MULTIPROCESS:
+        return
+    own = f"_{os.getpid()}.db"
+    for path in glob.glob(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "*.db")):
+        if not path.endswith(own):
+            os.remove(path)
+
+
+def mark_process_dead(pid: int):
+    """Called for a worker process that exited, drops its live gauge values."""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(pid)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Returns the exposition payload and its content type."""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_queue_collector)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
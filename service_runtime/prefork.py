@@ -0,0 +1,146 @@
+"""
+Pre-fork server mode.
+
+The master process loads the heavy models once, then forks SERVER_WORKERS uvicorn
+workers that all accept on the same listening socket. The model weights are only read
+after the fork, so the workers share them copy-on-write instead of each loading its
+own copy. Inside a worker CPU bound work runs on a small thread pool (no process pool,
+which would load the models again).
+
+    SERVER_WORKERS           number of forked workers            (default: 1, no fork)
+    WORKER_CPU_THREADS       CPU executor threads per worker      (default: 1)
+    WORKER_INTRAOP_THREADS   OpenMP/BLAS/OpenCV/torch threads
+                             per worker                           (default: cores / workers)
+"""
+
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Callable, Dict, Optional
+
+from .executor import ExecutorModeEnum, configure_cpu_executor
+from .metrics import clear_multiprocess_dir, mark_process_dead
+
+logger = logging.getLogger(__name__)
+
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", 1))
+WORKER_CPU_THREADS = int(os.getenv("WORKER_CPU_THREADS", 1))
+WORKER_INTRAOP_THREADS = int(
+    os.getenv(
+        "WORKER_INTRAOP_THREADS",
+        max(1, (os.cpu_count() or 1) // max(1, SERVER_WORKERS)),
+    )
+)
+
+# Read by the native libraries when they are first imported
+_THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "CPU_NUM",  # PaddlePaddle
+)
+
+# A worker that dies sooner than this after its start is respawned after a pause
+_MIN_WORKER_UPTIME = 5.0
+
+
+def limit_native_threads(threads: int):
+    """Caps the intra-op thread pools of the native libraries in this process."""
+    for var in _THREAD_ENV_VARS:
+        os.environ.setdefault(var, str(threads))
+    if "cv2" in sys.modules:
+        sys.modules["cv2"].setNumThreads(threads)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+
+
+def serve_prefork(
+    app,
+    host: str,
+    port: int,
+    workers: int = SERVER_WORKERS,
+    preload: Optional[Callable[[], None]] = None,
+    log_level: str = "info",
+):
+    """
+    Runs `preload` in the master, then forks `workers` uvicorn workers serving `app`
+    on a shared socket. Dead workers are replaced until the master gets SIGTERM/SIGINT.
+    """
+    import uvicorn
+
+    limit_native_threads(WORKER_INTRAOP_THREADS)
+    configure_cpu_executor(mode=ExecutorModeEnum.thread, workers=WORKER_CPU_THREADS)
+    clear_multiprocess_dir()
+
+    if preload is not None:
+        started = time.perf_counter()
+        preload()
+        logger.info(f"Master preloaded models in {time.perf_counter() - started:.1f}s")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    # Move everything allocated so far out of the GC generations, so the collector in
+    # the workers does not write to (and thereby copy) the shared pages.
+    gc.collect()
+    gc.freeze()
+
+    children: Dict[int, float] = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            limit_native_threads(WORKER_INTRAOP_THREADS)
+            config = uvicorn.Config(app=app, log_level=log_level)
+            try:
+                uvicorn.Server(config).run(sockets=[sock])
+            finally:
+                os._exit(0)
+        children[pid] = time.monotonic()
+        logger.info(f"Started worker {pid}")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(max(1, workers)):
+        spawn()
+
+    logger.info(f"Master {os.getpid()} serving on {host}:{port} with {workers} workers")
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        mark_process_dead(pid)
+        started_at = children.pop(pid, None)
+        if started_at is None or stopping:
+            continue
+        logger.error(f"Worker {pid} exited with status {status}, replacing it")
+        if time.monotonic() - started_at < _MIN_WORKER_UPTIME:
+            time.sleep(_MIN_WORKER_UPTIME)
+        if not stopping:
+            spawn()
+
+    sock.close()
@@ -0,0 +1,31 @@
+"""
+Stage progress reporting.
+
+Long running pipelines call `report_stage("ocr")` etc. as they move along. Callers
+that care (the job API) install a listener for the current context; without a
+listener the call is a no-op. Listeners are inherited by tasks spawned from the
+current context, they do not cross into the process pool.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, Optional
+
+_stage_listener: ContextVar[Optional[Callable[[str], None]]] = ContextVar(
+    "stage_listener", default=None
+)
+
+
+def report_stage(stage: str):
+    listener = _stage_listener.get()
+    if listener is not None:
+        listener(stage)
+
+
+@contextmanager
+def stage_listener(callback: Callable[[str], None]) -> Iterator[None]:
+    token = _stage_listener.set(callback)
+    try:
+        yield
+    finally:
+        _stage_listener.reset(token)
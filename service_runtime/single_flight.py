@@ -0,0 +1,37 @@
+"""
+Single-flight de-duplication of concurrent async calls.
+
+Concurrent callers asking for the same key await one shared in-flight call instead of
+each making their own, and all of them get its outcome, result or exception. Once the
+call has finished the next caller starts a new one, nothing is cached here.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        """Runs `call()` unless a call for `key` is already in flight, then awaits that one."""
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(call())
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._done(key, f))
+        # A cancelled caller must not cancel the call the others are waiting for
+        return await asyncio.shield(future)
+
+    def _done(self, key: Hashable, future: asyncio.Future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if not future.cancelled():
+            # Marks the exception as retrieved when every waiter has gone away
+            future.exception()
@@ -0,0 +1,31 @@
+"""
+Where the service keeps its state on disk: usage counts, the job store, the disk
+response cache and the shared license cache. Each file can still be set on its own
+(USAGE_SINK_PATH, JOB_STORE_PATH, ...), by default they all live in DATA_DIR.
+
+    DATA_DIR   (default: /data in Docker (DOCKER_ENV=true), else ~/lyik_services_data)
+
+In Docker, /data is a volume, so the files outlive the container.
+"""
+
+import os
+
+DATA_DIR = os.getenv(
+    "DATA_DIR",
+    "/data"
+    if os.getenv("DOCKER_ENV") == "true"
+    else os.path.expanduser("~/lyik_services_data"),
+)
+
+
+def data_path(name: str) -> str:
+    """Default location of a state file."""
+    return os.path.join(DATA_DIR, name)
+
+
+def ensure_parent_dir(path: str) -> str:
+    """Creates the directory of `path` if needed and returns the path."""
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    return path
@@ -0,0 +1,196 @@
+"""
+In-memory input abstraction for uploaded files.
+
+Uploads are read once into an `InputFile`. Model code decodes straight from memory
+(`to_ndarray`, `to_pil`, `open`) instead of copying the upload to a temp file and
+reading it back. Only uploads larger than UPLOAD_MEMORY_LIMIT bytes (default 32 MB)
+are spilled to disk, into UPLOAD_SPOOL_DIR (default: the temp directory). Setting it to
+/dev/shm keeps them in RAM, but Docker gives containers a 64 MB /dev/shm unless run
+with a larger `--shm-size`.
+`as_path()` is still available for the few libraries that insist on a file name.
+"""
+
+import mimetypes
+import os
+import shutil
+from contextlib import contextmanager
+from io import BytesIO
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Union
+
+from fastapi import UploadFile
+
+from .executor import run_io_bound
+
+UPLOAD_MEMORY_LIMIT = int(os.getenv("UPLOAD_MEMORY_LIMIT", 32 * 1024 * 1024))
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None
+
+
+class InputFile:
+    """
+    A single uploaded file, either held as bytes or spilled to a temp file.
+    Picklable, so it can be handed to the CPU process pool. Only the encoded
+    bytes (or the path) travel, decoded images are cached per process.
+    """
+
+    def __init__(
+        self,
+        data: Optional[bytes] = None,
+        path: Optional[str] = None,
+        filename: Optional[str] = None,
+        content_type: Optional[str] = None,
+        owns_path: bool = False,
+    ):
+        if data is None and path is None:
+            raise ValueError("InputFile needs either data or a path")
+        self._data = data
+        self._path = path
+        self.filename = filename or (Path(path).name if path else "")
+        self.content_type = content_type
+        self._owns_path = owns_path
+        self._cache: Dict[str, Any] = {}
+
+    # --- constructors ---------------------------------------------------------
+
+    @classmethod
+    async def from_upload(cls, upload: UploadFile) -> "InputFile":
+        """Reads an UploadFile into memory, or spills it to disk when it is large."""
+        size = upload.size
+        if size is not None and size > UPLOAD_MEMORY_LIMIT:
+            path = await run_io_bound(
+                _spill_to_disk, upload.file, Path(upload.filename or "").suffix
+            )
+            return cls(
+                path=path,
+                filename=upload.filename,
+                content_type=upload.content_type,
+                owns_path=True,
+            )
+        return cls(
+            data=await upload.read(),
+            filename=upload.filename,
+            content_type=upload.content_type,
+        )
+
+    @classmethod
+    def from_path(cls, path: Union[str, Path]) -> "InputFile":
+        return cls(path=str(path))
+
+    # --- properties -----------------------------------------------------------
+
+    @property
+    def suffix(self) -> str:
+        return Path(self.filename or self._path or "").suffix
+
+    @property
+    def size(self) -> int:
+        if self._data is not None:
+            return len(self._data)
+        return os.path.getsize(self._path)
+
+    @property
+    def in_memory(self) -> bool:
+        return self._data is not None
+
+    @property
+    def mime(self) -> Optional[str]:
+        """MIME type from magic bytes, falling back to the file extension."""
+        if "mime" not in self._cache:
+            import filetype
+
+            mime = None
+            try:
+                kind = filetype.guess(self._data if self.in_memory else self._path)
+                mime = kind.mime if kind else None
+            except Exception:
+                mime = None
+            if not mime:
+                mime, _ = mimetypes.guess_type(self.filename or self._path or "")
+            self._cache["mime"] = mime
+        return self._cache["mime"]
+
+    # --- readers --------------------------------------------------------------
+
+    def read_bytes(self) -> bytes:
+        if self._data is not None:
+            return self._data
+        return Path(self._path).read_bytes()
+
+    def open(self) -> BinaryIO:
+        """Readable binary stream over the content, without copying in-memory data."""
+        if self._data is not None:
+            return BytesIO(self._data)
+        return open(self._path, "rb")
+
+    def to_ndarray(self):
+        """Decodes the image to an OpenCV BGR array (EXIF orientation applied). Cached."""
+        if "ndarray" not in self._cache:
+            import cv2
+            import numpy as np
+
+            if self._data is not None:
+                image = cv2.imdecode(
+                    np.frombuffer(self._data, dtype=np.uint8), cv2.IMREAD_COLOR
+                )
+            else:
+                image = cv2.imread(self._path)
+            self._cache["ndarray"] = image
+        return self._cache["ndarray"]
+
+    def to_pil(self):
+        """Opens the image with PIL. A new image object on every call."""
+        from PIL import Image
+
+        return Image.open(self.open())
+
+    @contextmanager
+    def as_path(self) -> Iterator[str]:
+        """
+        Yields a file path for the content. Spilled files are used as is, in-memory
+        data is written to a temp file in UPLOAD_SPOOL_DIR only for the duration.
+        """
+        if self._path is not None:
+            yield self._path
+            return
+        with NamedTemporaryFile(
+            delete=True, suffix=self.suffix, dir=UPLOAD_SPOOL_DIR
+        ) as tmp:
+            tmp.write(self._data)
+            tmp.flush()
+            yield tmp.name
+
+    def close(self):
+        """Removes the spilled file, if this object created it."""
+        self._cache.clear()
+        if self._owns_path and self._path and os.path.exists(self._path):
+            os.remove(self._path)
+        self._owns_path = False
+
+    # --- pickling -------------------------------------------------------------
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Decoded images are large, the copy decodes again
+        state["_cache"] = {}
+        # The copy never deletes the spilled file
+        state["_owns_path"] = False
+        return state
+
+    def __repr__(self):
+        where = "memory" if self.in_memory else self._path
+        return f"InputFile(filename={self.filename!r}, size={self.size}, at={where})"
+
+
+def as_input_file(source: Union[str, Path, InputFile]) -> InputFile:
+    """Accepts an InputFile or a plain path, so handlers keep working with paths."""
+    if isinstance(source, InputFile):
+        return source
+    return InputFile.from_path(source)
+
+
+def _spill_to_disk(src: BinaryIO, suffix: str) -> str:
+    src.seek(0)
+    with NamedTemporaryFile(delete=False, suffix=suffix, dir=UPLOAD_SPOOL_DIR) as dst:
+        shutil.copyfileobj(src, dst)
+        return dst.name
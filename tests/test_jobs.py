@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from models import Job, JobStatusEnum
+from service_manager import jobs
+from service_manager.admission import ServiceOverloaded
+from service_manager.jobs import (
+    ABANDONED_JOB_ERROR,
+    InMemoryJobStore,
+    JobManager,
+    SQLiteJobStore,
+)
+
+
+class SlowJobStore(InMemoryJobStore):
+    """Saving yields to the event loop, so concurrent submits interleave."""
+
+    async def save(self, job):
+        await asyncio.sleep(0.01)
+        await super().save(job)
+
+
+def test_submit_raises_service_overloaded_when_the_queue_is_full():
+    async def run():
+        manager = JobManager(InMemoryJobStore(), workers=0, queue_size=1)
+        await manager.submit("ocr", [], {})
+        with pytest.raises(ServiceOverloaded) as overloaded:
+            await manager.submit("ocr", [], {})
+        return overloaded.value
+
+    overloaded = asyncio.run(run())
+    assert overloaded.service_name == "jobs"
+    assert overloaded.retry_after > 0
+
+
+def test_concurrent_submits_do_not_overfill_the_queue():
+    async def run():
+        manager = JobManager(SlowJobStore(), workers=0, queue_size=3)
+        results = await asyncio.gather(
+            *(manager.submit("ocr", [], {}) for _ in range(10)), return_exceptions=True
+        )
+        return manager, results
+
+    manager, results = asyncio.run(run())
+    assert sum(not isinstance(r, Exception) for r in results) == 3
+    assert sum(isinstance(r, ServiceOverloaded) for r in results) == 7
+    assert manager._queue.qsize() == 3
+    assert manager._reserved == 0
+
+
+def _queued_job(job_id: str) -> Job:
+    return Job(job_id=job_id, service_name="ocr", stage="queued", created_at=0.0)
+
+
+def test_jobs_of_a_stopped_process_are_failed(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(jobs.time, "time", lambda: now[0])
+    path = str(tmp_path / "jobs.sqlite3")
+
+    async def run():
+        stopped = SQLiteJobStore(path=path, abandoned_after=30)
+        alive = SQLiteJobStore(path=path, abandoned_after=30)
+        await stopped.save(_queued_job("lost"))
+        await alive.save(_queued_job("kept"))
+
+        now[0] += 60
+        await alive.keep_alive()
+        failed = await alive.fail_abandoned()
+        return failed, await alive.get("lost"), await alive.get("kept")
+
+    failed, lost, kept = asyncio.run(run())
+    assert failed == 1
+    assert lost.status == JobStatusEnum.failed
+    assert lost.error == ABANDONED_JOB_ERROR
+    assert lost.result.message == ABANDONED_JOB_ERROR
+    assert kept.status == JobStatusEnum.queued
+
+
+def test_stopping_fails_the_jobs_of_this_process(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+
+    async def run():
+        manager = JobManager(SQLiteJobStore(path=path), workers=0, queue_size=1)
+        job = await manager.submit("ocr", [], {})
+        await manager.stop()
+        return await SQLiteJobStore(path=path).get(job.job_id)
+
+    assert asyncio.run(run()).status == JobStatusEnum.failed
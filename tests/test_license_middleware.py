@@ -0,0 +1,142 @@
+import asyncio
+
+import httpx
+
+from license_manager import middleware
+from license_manager.middleware import LicenseMiddleware, _find_field
+
+BOUNDARY = "XyZ"
+DELIMITER = b"--" + BOUNDARY.encode()
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+
+
+def _field(name: str, value: str) -> bytes:
+    return (
+        DELIMITER + b"\r\n"
+        + f'Content-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+    )
+
+
+def _file(name: str, content: bytes) -> bytes:
+    return (
+        DELIMITER + b"\r\n"
+        + f'Content-Disposition: form-data; name="{name}"; filename="a.jpg"\r\n'.encode()
+        + b"Content-Type: image/jpeg\r\n\r\n"
+        + content + b"\r\n"
+    )
+
+
+def _body(*parts: bytes) -> bytes:
+    return b"".join(parts) + DELIMITER + b"--\r\n"
+
+
+class FakeLicenseManager:
+    """Valid for the key "good", records the keys it verified."""
+
+    verified = []
+
+    def __init__(self, license_key: str):
+        self.license_key = license_key
+
+    async def verify(self):
+        FakeLicenseManager.verified.append(self.license_key)
+        if self.license_key == "good":
+            return True, "License is valid"
+        return False, "Invalid license"
+
+
+async def _endpoint(scope, receive, send):
+    """Echoes the body it received and whether the license was verified."""
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    verified = scope.get("state", {}).get("license_verified", False)
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"x-license-verified", str(verified).encode())],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+def _post(body: bytes, headers: dict = None) -> httpx.Response:
+    async def post():
+        app = LicenseMiddleware(_endpoint, paths=["/process"])
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(
+                "/process",
+                content=body,
+                headers={"content-type": CONTENT_TYPE, **(headers or {})},
+            )
+
+    return asyncio.run(post())
+
+
+def _setup(monkeypatch):
+    FakeLicenseManager.verified = []
+    monkeypatch.setattr(middleware, "LicenseManager", FakeLicenseManager)
+
+
+def test_find_field_before_the_files():
+    data = _body(_field("service_name", "ocr"), _field("license_key", " abc "), _file("files", b"x"))
+    assert _find_field(data, DELIMITER) == ("abc", True)
+
+
+def test_find_field_stops_at_the_first_file():
+    data = _body(_file("files", b"x"), _field("license_key", "abc"))
+    assert _find_field(data, DELIMITER) == (None, True)
+
+
+def test_find_field_waits_for_an_incomplete_part():
+    data = _field("license_key", "abc")[:-10]
+    assert _find_field(data, DELIMITER) == (None, False)
+
+
+def test_key_before_the_files_is_verified_and_the_body_replayed(monkeypatch):
+    _setup(monkeypatch)
+    body = _body(_field("license_key", "good"), _file("files", b"\xff" * 1000))
+
+    response = _post(body)
+
+    assert FakeLicenseManager.verified == ["good"]
+    assert response.headers["x-license-verified"] == "True"
+    assert response.content == body
+
+
+def test_invalid_key_before_the_files_is_rejected(monkeypatch):
+    _setup(monkeypatch)
+    body = _body(_field("license_key", "bad"), _file("files", b"\xff" * 1000))
+
+    response = _post(body)
+
+    assert FakeLicenseManager.verified == ["bad"]
+    assert response.json()["status"] == "failure"
+    assert response.json()["message"] == "Invalid license"
+
+
+def test_key_after_the_files_is_left_to_the_endpoint(monkeypatch):
+    _setup(monkeypatch)
+    body = _body(_file("files", b"\xff" * 1000), _field("license_key", "bad"))
+
+    response = _post(body)
+
+    assert FakeLicenseManager.verified == []
+    assert response.headers["x-license-verified"] == "False"
+    assert response.content == body
+
+
+def test_header_key_is_verified_without_reading_the_body(monkeypatch):
+    _setup(monkeypatch)
+    body = _body(_file("files", b"\xff" * 1000), _field("license_key", "bad"))
+
+    response = _post(body, headers={"X-License-Key": "good"})
+
+    assert FakeLicenseManager.verified == ["good"]
+    assert response.headers["x-license-verified"] == "True"
+    assert response.content == body
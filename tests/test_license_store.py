@@ -0,0 +1,65 @@
+import itertools
+
+import pytest
+
+from license_manager import store
+from license_manager.store import SQLiteLicenseStore
+
+
+@pytest.fixture
+def make_store(tmp_path, monkeypatch):
+    # A clock that moves on at every call, so every write and read has its own time
+    clock = itertools.count(1000)
+    monkeypatch.setattr(store.time, "time", lambda: float(next(clock)))
+
+    def make(eviction: str) -> SQLiteLicenseStore:
+        return SQLiteLicenseStore(
+            "license", maxsize=2, ttl=3600, eviction=eviction,
+            path=str(tmp_path / f"{eviction}.sqlite3"),
+        )
+
+    return make
+
+
+def _keys(s: SQLiteLicenseStore) -> set:
+    rows = s._conn.execute(
+        "SELECT key FROM license_cache WHERE namespace = ?", (s.namespace,)
+    ).fetchall()
+    return {key for (key,) in rows}
+
+
+def test_lru_evicts_the_least_recently_used(make_store):
+    s = make_store("lru")
+    s._set_sync("a", "{}")
+    s._set_sync("b", "{}")
+    s._get_sync("a")
+    s._set_sync("c", "{}")
+    assert _keys(s) == {"a", "c"}
+
+
+def test_lfu_evicts_the_least_frequently_used(make_store):
+    s = make_store("lfu")
+    s._set_sync("a", "{}")
+    s._set_sync("b", "{}")
+    s._get_sync("b")
+    s._get_sync("b")
+    s._get_sync("a")  # more recent, but fewer hits
+    s._set_sync("c", "{}")
+    assert _keys(s) == {"b", "c"}
+
+
+def test_fifo_evicts_the_oldest_even_when_refreshed(make_store):
+    s = make_store("fifo")
+    s._set_sync("a", "{}")
+    s._set_sync("b", "{}")
+    s._get_sync("a")
+    s._set_sync("a", "{}")  # a refresh keeps the creation time
+    s._set_sync("c", "{}")
+    assert _keys(s) == {"b", "c"}
+
+
+def test_expired_entries_are_not_read(make_store):
+    s = make_store("lru")
+    s.ttl = -1
+    s._set_sync("a", "{}")
+    assert s._get_sync("a") is None
@@ -0,0 +1,23 @@
+import asyncio
+
+from service_manager.response_cache import response_cache_key
+from service_runtime import InputFile
+
+
+def _key(license_key: str, content: bytes = b"card") -> str:
+    files = [InputFile(data=content, filename="card.jpg")]
+    return asyncio.run(
+        response_cache_key("ocr", files, {"license_key": license_key}, [])
+    )
+
+
+def test_same_upload_and_tenant_share_a_key():
+    assert _key("tenant-a") == _key("tenant-a")
+
+
+def test_keys_are_scoped_per_tenant():
+    assert _key("tenant-a") != _key("tenant-b")
+
+
+def test_keys_depend_on_the_upload():
+    assert _key("tenant-a", b"one") != _key("tenant-a", b"two")
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from service_runtime.single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call_and_its_failure():
+    calls = 0
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise ValueError("licensing server down")
+
+    async def run():
+        flight = SingleFlight()
+        results = await asyncio.gather(
+            *(flight.do("key", failing) for _ in range(5)), return_exceptions=True
+        )
+        return flight, results
+
+    flight, results = asyncio.run(run())
+    assert calls == 1
+    assert all(isinstance(r, ValueError) for r in results)
+    assert not flight.in_flight("key")
+
+
+def test_a_failure_is_not_cached():
+    calls = 0
+
+    async def flaky():
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise ValueError("first call fails")
+        return "ok"
+
+    async def run():
+        flight = SingleFlight()
+        with pytest.raises(ValueError):
+            await flight.do("key", flaky)
+        return await flight.do("key", flaky)
+
+    assert asyncio.run(run()) == "ok"
+    assert calls == 2
+
+
+def test_a_cancelled_caller_does_not_cancel_the_others():
+    async def slow():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def run():
+        flight = SingleFlight()
+        first = asyncio.ensure_future(flight.do("key", slow))
+        second = asyncio.ensure_future(flight.do("key", slow))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second, first.cancelled()
+
+    assert asyncio.run(run()) == ("done", True)